@@ -0,0 +1,51 @@
+"""add user_solved_problems as the first-solve guard
+
+Revision ID: a3b4c5d6e7f8
+Revises: f2a3b4c5d6e7
+Create Date: 2026-10-20 09:48:05.331602
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3b4c5d6e7f8'
+down_revision: Union[str, Sequence[str], None] = 'f2a3b4c5d6e7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('user_solved_problems',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('source', sa.String(length=10), nullable=False),
+        sa.Column('problem_id', sa.Integer(), nullable=False),
+        sa.Column('solved_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id', 'source', 'problem_id')
+    )
+
+    # Backfill from the first passing attempt of each problem
+    op.execute(sa.text("""
+    INSERT INTO user_solved_problems (user_id, source, problem_id, solved_at)
+    SELECT s.user_id, s.source, s.problem_id, MIN(s.solved_at)
+    FROM (
+        SELECT user_id, 'TEST' AS source, problem_id, created_at AS solved_at
+        FROM submissions WHERE verdict = 'Passed'
+        UNION ALL
+        SELECT user_id, 'LEARNING' AS source, problem_id, timestamp AS solved_at
+        FROM submission_logs WHERE verdict = 'Passed'
+    ) s
+    JOIN users u ON u.id = s.user_id
+    WHERE s.problem_id IS NOT NULL
+    GROUP BY s.user_id, s.source, s.problem_id
+    """))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('user_solved_problems')
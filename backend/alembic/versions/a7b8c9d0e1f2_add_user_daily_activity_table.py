@@ -0,0 +1,47 @@
+"""add user_daily_activity table
+
+Revision ID: a7b8c9d0e1f2
+Revises: f6a7b8c9d0e1
+Create Date: 2026-10-19 12:08:39.226410
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7b8c9d0e1f2'
+down_revision: Union[str, Sequence[str], None] = 'f6a7b8c9d0e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('user_daily_activity',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('passes', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id', 'day')
+    )
+
+    # Backfill from submissions and submission_logs
+    op.execute(sa.text("""
+    INSERT INTO user_daily_activity (user_id, day, attempts, passes)
+    SELECT a.user_id, a.day, COUNT(*), COUNT(*) FILTER (WHERE a.verdict = 'Passed')
+    FROM (
+        SELECT user_id, verdict, created_at::date AS day FROM submissions
+        UNION ALL
+        SELECT user_id, verdict, timestamp::date AS day FROM submission_logs
+    ) a
+    JOIN users u ON u.id = a.user_id
+    GROUP BY a.user_id, a.day"""))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('user_daily_activity')
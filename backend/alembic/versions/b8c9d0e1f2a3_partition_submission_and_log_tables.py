@@ -0,0 +1,209 @@
+"""partition submissions, submission_logs and behavior_logs by month
+
+The partition key becomes part of the primary key, so it cannot be NULL.
+Rows with a NULL time are first dated from a related row where one exists
+(test submissions and proctoring events from their scheduled test's start,
+proctoring events from their submission). The migration refuses to run if any
+NULLs remain; it never re-dates history to the migration time.
+
+Revision ID: b8c9d0e1f2a3
+Revises: a7b8c9d0e1f2
+Create Date: 2026-10-19 14:02:51.804417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8c9d0e1f2a3'
+down_revision: Union[str, Sequence[str], None] = 'a7b8c9d0e1f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+MONTHS_AHEAD = 3
+
+# table -> (partition column, indexes, foreign keys)
+# Indexes are (name, columns); foreign keys are (name, column, referenced table, ondelete)
+TABLES = {
+    "submissions": ("created_at", [
+        ("ix_submissions_id", ["id"]),
+        ("ix_submissions_user_id_created_at", ["user_id", "created_at"]),
+        ("ix_submissions_test_id_user_id", ["test_id", "user_id"]),
+        ("ix_submissions_problem_id_created_at", ["problem_id", "created_at"]),
+    ], [
+        ("fk_submissions_user_id", "user_id", "users", None),
+        ("fk_submissions_problem_id", "problem_id", "problems", None),
+        ("fk_submissions_test_id", "test_id", "scheduled_tests", None),
+    ]),
+    "submission_logs": ("timestamp", [
+        ("ix_submission_logs_id", ["id"]),
+        ("ix_submission_logs_user_id", ["user_id"]),
+        ("ix_submission_logs_problem_id", ["problem_id"]),
+        ("ix_submission_logs_user_id_timestamp", ["user_id", "timestamp"]),
+    ], [
+        ("fk_submission_logs_user_id", "user_id", "users", "CASCADE"),
+        ("fk_submission_logs_problem_id", "problem_id", "course_problems", "CASCADE"),
+    ]),
+    "behavior_logs": ("timestamp", [
+        ("ix_behavior_logs_id", ["id"]),
+        ("ix_behavior_logs_test_id_user_id", ["test_id", "user_id"]),
+    ], [
+        ("fk_behavior_logs_user_id", "user_id", "users", None),
+        ("fk_behavior_logs_problem_id", "problem_id", "problems", None),
+        ("fk_behavior_logs_test_id", "test_id", "scheduled_tests", None),
+    ]),
+}
+
+# Creates the monthly partitions of `parent` covering [from_month, to_month].
+# Also called by app.services.partitions to keep partitions created ahead of time.
+ENSURE_PARTITIONS_FUNCTION = """
+CREATE OR REPLACE FUNCTION ensure_monthly_partitions(parent text, from_month date, to_month date)
+RETURNS integer AS $$
+DECLARE
+    month date := date_trunc('month', from_month)::date;
+    created integer := 0;
+    part text;
+BEGIN
+    WHILE month <= to_month LOOP
+        part := format('%s_p%s', parent, to_char(month, 'YYYY_MM'));
+        IF to_regclass(part) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                part, parent,
+                to_char(month, 'YYYY-MM-DD') || ' 00:00:00+00',
+                to_char((month + interval '1 month')::date, 'YYYY-MM-DD') || ' 00:00:00+00'
+            );
+            created := created + 1;
+        END IF;
+        month := (month + interval '1 month')::date;
+    END LOOP;
+    RETURN created;
+END
+$$ LANGUAGE plpgsql"""
+
+
+def _is_partitioned(bind, table: str) -> bool:
+    return bind.execute(
+        sa.text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:t))"),
+        {"t": table}
+    ).scalar()
+
+
+# table -> UPDATE statements that date NULL partition keys from related rows, in order
+BACKFILLS = {
+    "submissions": [
+        """UPDATE submissions s SET created_at = t.start_time
+           FROM scheduled_tests t
+           WHERE s.created_at IS NULL AND t.id = s.test_id AND t.start_time IS NOT NULL""",
+    ],
+    "submission_logs": [],
+    "behavior_logs": [
+        """UPDATE behavior_logs b SET "timestamp" = s.created_at
+           FROM submissions s
+           WHERE b."timestamp" IS NULL AND s.id = b.submission_id AND s.created_at IS NOT NULL""",
+        """UPDATE behavior_logs b SET "timestamp" = t.start_time
+           FROM scheduled_tests t
+           WHERE b."timestamp" IS NULL AND t.id = b.test_id AND t.start_time IS NOT NULL""",
+    ],
+}
+
+
+def _date_null_rows(bind, tables: list) -> None:
+    """Backfill NULL partition keys from related rows; fail if any remain."""
+    remaining = {}
+    for table in tables:
+        for statement in BACKFILLS[table]:
+            op.execute(sa.text(statement))
+        column = TABLES[table][0]
+        count = bind.execute(sa.text(f'SELECT count(*) FROM {table} WHERE "{column}" IS NULL')).scalar()
+        if count:
+            remaining[f"{table}.{column}"] = count
+    if remaining:
+        raise RuntimeError(
+            f"Cannot partition: rows without a timestamp and no related row to date them from: {remaining}. "
+            "Set these columns (or delete the rows) and re-run the migration."
+        )
+
+
+def _drop_constraints(bind, table: str, contype: str, referenced: str = None) -> None:
+    query = "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(:t) AND contype = :c"
+    params = {"t": table, "c": contype}
+    if referenced:
+        query += " AND confrelid = to_regclass(:r)"
+        params["r"] = referenced
+    for name in bind.execute(sa.text(query), params).scalars().all():
+        op.execute(sa.text(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"'))
+
+
+def _rebuild_table(bind, table: str, partitioned: bool) -> None:
+    """
+    Move `table` into a new table with the same columns, either monthly
+    partitioned on its time column or back to a plain heap.
+    """
+    column, indexes, foreign_keys = TABLES[table]
+    old = f"{table}_old"
+
+    # Free the old table's names: constraints, FKs and the id sequence
+    _drop_constraints(bind, table, "p")
+    _drop_constraints(bind, table, "f")
+    sequence = bind.execute(sa.text("SELECT pg_get_serial_sequence(:t, 'id')"), {"t": table}).scalar()
+    op.execute(sa.text(f"ALTER SEQUENCE {sequence} OWNED BY NONE"))
+    op.execute(sa.text(f"ALTER TABLE {table} RENAME TO {old}"))
+
+    if partitioned:
+        # The partition key must be part of the primary key (NULLs were dated or rejected up front)
+        op.execute(sa.text(
+            f'CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS, PRIMARY KEY (id, "{column}")) '
+            f'PARTITION BY RANGE ("{column}")'
+        ))
+        op.execute(sa.text(
+            f"SELECT ensure_monthly_partitions('{table}', "
+            f"COALESCE((SELECT min(\"{column}\") FROM {old}), now())::date, "
+            f"(now() + interval '{MONTHS_AHEAD} months')::date)"
+        ))
+        op.execute(sa.text(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT"))
+    else:
+        op.execute(sa.text(f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS, PRIMARY KEY (id))"))
+        op.execute(sa.text(f'ALTER TABLE {table} ALTER COLUMN "{column}" DROP NOT NULL'))
+
+    op.execute(sa.text(f"INSERT INTO {table} SELECT * FROM {old}"))
+    op.execute(sa.text(f"DROP TABLE {old} CASCADE"))
+    op.execute(sa.text(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id"))
+
+    # Built after the copy; on a partitioned parent they cascade to every partition
+    for name, columns in indexes:
+        op.create_index(name, table, columns, unique=False)
+    for name, local, remote, ondelete in foreign_keys:
+        op.create_foreign_key(name, table, remote, [local], ["id"], ondelete=ondelete)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    op.execute(sa.text(ENSURE_PARTITIONS_FUNCTION))
+
+    # A foreign key to a partitioned table must cover its whole primary key,
+    # so behavior_logs.submission_id stays a plain column from here on
+    _drop_constraints(bind, "behavior_logs", "f", referenced="submissions")
+
+    pending = [table for table in TABLES if not _is_partitioned(bind, table)]
+    _date_null_rows(bind, pending)
+    for table in pending:
+        _rebuild_table(bind, table, partitioned=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    for table in reversed(list(TABLES)):
+        if _is_partitioned(bind, table):
+            _rebuild_table(bind, table, partitioned=False)
+
+    op.create_foreign_key(
+        "fk_behavior_logs_submission_id", "behavior_logs", "submissions", ["submission_id"], ["id"]
+    )
+    op.execute(sa.text("DROP FUNCTION IF EXISTS ensure_monthly_partitions(text, date, date)"))
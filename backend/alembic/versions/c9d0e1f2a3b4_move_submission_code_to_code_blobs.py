@@ -0,0 +1,86 @@
+"""move submission source code into content-addressed code_blobs
+
+Revision ID: c9d0e1f2a3b4
+Revises: b8c9d0e1f2a3
+Create Date: 2026-10-19 15:21:07.516093
+
+"""
+import hashlib
+import zlib
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9d0e1f2a3b4'
+down_revision: Union[str, Sequence[str], None] = 'b8c9d0e1f2a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+BATCH_SIZE = 500
+COMPRESSION_LEVEL = 6
+
+code_blobs = sa.table('code_blobs',
+    sa.column('sha256', sa.String),
+    sa.column('data', sa.LargeBinary),
+    sa.column('size', sa.Integer),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    op.create_table('code_blobs',
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('sha256')
+    )
+    op.add_column('submissions', sa.Column('code_sha256', sa.String(length=64), nullable=True))
+
+    # Compression has to happen in Python, so stream each distinct source once
+    rows = bind.execution_options(stream_results=True, yield_per=BATCH_SIZE).execute(
+        sa.text("SELECT DISTINCT code FROM submissions WHERE code IS NOT NULL")
+    )
+    for batch in rows.partitions(BATCH_SIZE):
+        blobs = []
+        for (code,) in batch:
+            raw = code.encode("utf-8")
+            blobs.append({
+                "sha256": hashlib.sha256(raw).hexdigest(),
+                "data": zlib.compress(raw, COMPRESSION_LEVEL),
+                "size": len(raw)
+            })
+        op.bulk_insert(code_blobs, blobs)
+
+    # Same digest as hashlib over the UTF-8 bytes
+    op.execute(sa.text(
+        "UPDATE submissions SET code_sha256 = encode(sha256(convert_to(code, 'UTF8')), 'hex') "
+        "WHERE code IS NOT NULL"
+    ))
+    op.create_foreign_key('fk_submissions_code_sha256', 'submissions', 'code_blobs', ['code_sha256'], ['sha256'])
+    op.drop_column('submissions', 'code')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    op.add_column('submissions', sa.Column('code', sa.Text(), nullable=True))
+
+    rows = bind.execution_options(stream_results=True, yield_per=BATCH_SIZE).execute(
+        sa.text("SELECT sha256, data FROM code_blobs")
+    )
+    update = sa.text("UPDATE submissions SET code = :code WHERE code_sha256 = :sha256")
+    for batch in rows.partitions(BATCH_SIZE):
+        bind.execute(update, [
+            {"sha256": sha256, "code": zlib.decompress(data).decode("utf-8")}
+            for sha256, data in batch
+        ])
+
+    op.drop_constraint('fk_submissions_code_sha256', 'submissions', type_='foreignkey')
+    op.drop_column('submissions', 'code_sha256')
+    op.drop_table('code_blobs')
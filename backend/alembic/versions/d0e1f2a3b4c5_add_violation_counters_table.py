@@ -0,0 +1,47 @@
+"""add violation_counters table
+
+Revision ID: d0e1f2a3b4c5
+Revises: c9d0e1f2a3b4
+Create Date: 2026-10-19 16:40:12.093581
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd0e1f2a3b4c5'
+down_revision: Union[str, Sequence[str], None] = 'c9d0e1f2a3b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('violation_counters',
+        sa.Column('test_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('event_type', sa.String(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['test_id'], ['scheduled_tests.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('test_id', 'user_id', 'event_type')
+    )
+
+    # Backfill from the raw proctoring log
+    op.execute(sa.text("""
+    INSERT INTO violation_counters (test_id, user_id, event_type, count)
+    SELECT b.test_id, b.user_id, b.event_type, COUNT(*)
+    FROM behavior_logs b
+    JOIN scheduled_tests t ON t.id = b.test_id
+    JOIN users u ON u.id = b.user_id
+    WHERE b.event_type IS NOT NULL
+    GROUP BY b.test_id, b.user_id, b.event_type"""))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('violation_counters')
@@ -0,0 +1,44 @@
+"""add composite indexes for hot submission, log and behavior queries
+
+Revision ID: d4e5f6a7b8c9
+Revises: f2fe8f7d730e
+Create Date: 2026-10-19 09:12:04.318220
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4e5f6a7b8c9'
+down_revision: Union[str, Sequence[str], None] = 'f2fe8f7d730e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (index name, table, columns)
+INDEXES = [
+    ("ix_submissions_user_id_created_at", "submissions", ["user_id", "created_at"]),
+    ("ix_submissions_test_id_user_id", "submissions", ["test_id", "user_id"]),
+    ("ix_submissions_problem_id_created_at", "submissions", ["problem_id", "created_at"]),
+    ("ix_behavior_logs_test_id_user_id", "behavior_logs", ["test_id", "user_id"]),
+    ("ix_submission_logs_user_id_timestamp", "submission_logs", ["user_id", "timestamp"]),
+    ("ix_test_enrollments_test_id_user_id_status", "test_enrollments", ["test_id", "user_id", "status"]),
+    ("ix_scheduled_tests_active_window", "scheduled_tests", ["is_active", "start_time", "end_time"]),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
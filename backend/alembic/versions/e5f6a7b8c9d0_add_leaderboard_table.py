@@ -0,0 +1,46 @@
+"""add leaderboard read model
+
+Revision ID: e5f6a7b8c9d0
+Revises: d4e5f6a7b8c9
+Create Date: 2026-10-19 10:02:47.551903
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5f6a7b8c9d0'
+down_revision: Union[str, Sequence[str], None] = 'd4e5f6a7b8c9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('leaderboard',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('solved', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_index('ix_leaderboard_solved_user_id', 'leaderboard', ['solved', 'user_id'], unique=False)
+
+    # Backfill from existing submissions
+    op.execute(sa.text("""
+        INSERT INTO leaderboard (user_id, solved, updated_at)
+        SELECT s.user_id, COUNT(*), now()
+        FROM submissions s
+        JOIN users u ON u.id = s.user_id
+        WHERE s.verdict = 'Passed' AND UPPER(COALESCE(u.role, 'STUDENT')) != 'ADMIN'
+        GROUP BY s.user_id
+    """))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_leaderboard_solved_user_id', table_name='leaderboard')
+    op.drop_table('leaderboard')
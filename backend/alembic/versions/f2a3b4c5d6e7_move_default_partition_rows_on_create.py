@@ -0,0 +1,118 @@
+"""let ensure_monthly_partitions move rows out of the default partition
+
+Revision ID: f2a3b4c5d6e7
+Revises: e1f2a3b4c5d6
+Create Date: 2026-10-20 09:12:38.250917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a3b4c5d6e7'
+down_revision: Union[str, Sequence[str], None] = 'e1f2a3b4c5d6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# If maintenance lapsed, rows for a month without a partition sit in the
+# default partition, and CREATE TABLE ... PARTITION OF for that month fails on
+# them forever. In that case the partition is built as a standalone table, the
+# month's rows are moved into it from the default partition, and it is then
+# attached (which creates its indexes and foreign keys).
+ENSURE_PARTITIONS_FUNCTION = """
+CREATE OR REPLACE FUNCTION ensure_monthly_partitions(parent text, from_month date, to_month date)
+RETURNS integer AS $$
+DECLARE
+    month date := date_trunc('month', from_month)::date;
+    created integer := 0;
+    part text;
+    lower_bound text;
+    upper_bound text;
+    default_part regclass;
+    key_column text;
+    has_rows boolean;
+BEGIN
+    SELECT NULLIF(p.partdefid, 0)::regclass, a.attname
+      INTO default_part, key_column
+      FROM pg_partitioned_table p
+      JOIN pg_attribute a ON a.attrelid = p.partrelid AND a.attnum = p.partattrs[0]
+     WHERE p.partrelid = parent::regclass;
+
+    WHILE month <= to_month LOOP
+        part := format('%s_p%s', parent, to_char(month, 'YYYY_MM'));
+        IF to_regclass(part) IS NULL THEN
+            lower_bound := to_char(month, 'YYYY-MM-DD') || ' 00:00:00+00';
+            upper_bound := to_char((month + interval '1 month')::date, 'YYYY-MM-DD') || ' 00:00:00+00';
+
+            has_rows := false;
+            IF default_part IS NOT NULL THEN
+                EXECUTE format(
+                    'SELECT EXISTS (SELECT 1 FROM %s WHERE %I >= %L AND %I < %L)',
+                    default_part, key_column, lower_bound, key_column, upper_bound
+                ) INTO has_rows;
+            END IF;
+
+            IF has_rows THEN
+                EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', part, parent);
+                EXECUTE format(
+                    'WITH moved AS (DELETE FROM %s WHERE %I >= %L AND %I < %L RETURNING *) '
+                    'INSERT INTO %I SELECT * FROM moved',
+                    default_part, key_column, lower_bound, key_column, upper_bound, part
+                );
+                EXECUTE format(
+                    'ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                    parent, part, lower_bound, upper_bound
+                );
+            ELSE
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                    part, parent, lower_bound, upper_bound
+                );
+            END IF;
+            created := created + 1;
+        END IF;
+        month := (month + interval '1 month')::date;
+    END LOOP;
+    RETURN created;
+END
+$$ LANGUAGE plpgsql"""
+
+# As created by b8c9d0e1f2a3
+PREVIOUS_FUNCTION = """
+CREATE OR REPLACE FUNCTION ensure_monthly_partitions(parent text, from_month date, to_month date)
+RETURNS integer AS $$
+DECLARE
+    month date := date_trunc('month', from_month)::date;
+    created integer := 0;
+    part text;
+BEGIN
+    WHILE month <= to_month LOOP
+        part := format('%s_p%s', parent, to_char(month, 'YYYY_MM'));
+        IF to_regclass(part) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                part, parent,
+                to_char(month, 'YYYY-MM-DD') || ' 00:00:00+00',
+                to_char((month + interval '1 month')::date, 'YYYY-MM-DD') || ' 00:00:00+00'
+            );
+            created := created + 1;
+        END IF;
+        month := (month + interval '1 month')::date;
+    END LOOP;
+    RETURN created;
+END
+$$ LANGUAGE plpgsql"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(sa.text(ENSURE_PARTITIONS_FUNCTION))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(sa.text(PREVIOUS_FUNCTION))
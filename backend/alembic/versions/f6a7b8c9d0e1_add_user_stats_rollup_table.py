@@ -0,0 +1,77 @@
+"""add user_stats rollup table
+
+Revision ID: f6a7b8c9d0e1
+Revises: e5f6a7b8c9d0
+Create Date: 2026-10-19 11:25:13.904117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6a7b8c9d0e1'
+down_revision: Union[str, Sequence[str], None] = 'e5f6a7b8c9d0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('user_stats',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('total_attempts', sa.Integer(), nullable=False),
+        sa.Column('passed_attempts', sa.Integer(), nullable=False),
+        sa.Column('failed_attempts', sa.Integer(), nullable=False),
+        sa.Column('unique_solved', sa.Integer(), nullable=False),
+        sa.Column('last_active_date', sa.Date(), nullable=True),
+        sa.Column('current_streak', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+
+    # Backfill from submissions and submission_logs
+    op.execute(sa.text("""
+    WITH attempts AS (
+        SELECT user_id, problem_id, verdict, created_at::date AS day, 'TEST' AS source FROM submissions
+        UNION ALL
+        SELECT user_id, problem_id, verdict, timestamp::date AS day, 'LEARNING' AS source FROM submission_logs
+    ),
+    totals AS (
+        SELECT
+            user_id,
+            COUNT(*) AS total_attempts,
+            COUNT(*) FILTER (WHERE verdict = 'Passed') AS passed_attempts,
+            COUNT(*) FILTER (WHERE verdict IS DISTINCT FROM 'Passed') AS failed_attempts,
+            COUNT(DISTINCT problem_id) FILTER (WHERE verdict = 'Passed' AND source = 'TEST')
+              + COUNT(DISTINCT problem_id) FILTER (WHERE verdict = 'Passed' AND source = 'LEARNING') AS unique_solved
+        FROM attempts
+        GROUP BY user_id
+    ),
+    days AS (
+        SELECT DISTINCT user_id, day FROM attempts
+    ),
+    islands AS (
+        -- Consecutive days share the same (day - row_number) anchor
+        SELECT user_id, day, day - (ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY day))::int AS anchor
+        FROM days
+    ),
+    latest_run AS (
+        SELECT DISTINCT ON (user_id) user_id, MAX(day) AS last_active_date, COUNT(*) AS current_streak
+        FROM islands
+        GROUP BY user_id, anchor
+        ORDER BY user_id, MAX(day) DESC
+    )
+    INSERT INTO user_stats (user_id, total_attempts, passed_attempts, failed_attempts, unique_solved, last_active_date, current_streak, updated_at)
+    SELECT t.user_id, t.total_attempts, t.passed_attempts, t.failed_attempts, t.unique_solved, r.last_active_date, r.current_streak, now()
+    FROM totals t
+    JOIN latest_run r ON r.user_id = t.user_id
+    JOIN users u ON u.id = t.user_id"""))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('user_stats')
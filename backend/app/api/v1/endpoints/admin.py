@@ -1,34 +1,40 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from datetime import datetime
 from app.db import database
 from app.models import models
 from app.schemas import schemas
+from app.api.deps import get_current_admin
+from app.services.rate_limiter import submission_limiter
+from app.services import leaderboard, test_cases
+from app.services.invalidation_bus import invalidation_bus
+from app.services.partitions import partition_maintenance
+from app.services.behavior_buffer import behavior_buffer
+from app.services.proctoring_rules import proctoring_rules
 
 router = APIRouter()
 
 @router.get("/leaderboard")
-def get_leaderboard(db: Session = Depends(database.get_db)):
-    # Leaderboard logic: Most solved count, excluding admins (case-insensitive)
-    from sqlalchemy import func
-    users = db.query(models.User).filter(func.upper(models.User.role) != "ADMIN").all()
-    leaderboard = []
-    
-    for user in users:
-        solved = db.query(models.Submission).filter(
-            models.Submission.user_id == user.id, 
-            models.Submission.verdict == "Passed"
-        ).count()
-        
-        leaderboard.append({
-            "id": user.id,
-            "username": user.username,
-            "solved": solved,
-            "role": user.role
-        })
-        
-    return sorted(leaderboard, key=lambda x: x["solved"], reverse=True)
+def get_leaderboard(skip: int = 0, limit: int = 100, db: Session = Depends(database.get_db)):
+    # Leaderboard logic: Most solved count, excluding admins (served from the leaderboard read model)
+    limit = max(1, min(limit, 500))
+    return leaderboard.get_page(db, skip=max(0, skip), limit=limit)
+
+@router.get("/leaderboard/rank/{user_id}")
+def get_leaderboard_rank(user_id: int, db: Session = Depends(database.get_db)):
+    entry = leaderboard.get_user_rank(db, user_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail="User not found")
+    return entry
+
+@router.post("/leaderboard/rebuild")
+def rebuild_leaderboard(db: Session = Depends(database.get_db), current_admin: models.User = Depends(get_current_admin)):
+    """Recompute the leaderboard read model from submissions"""
+    ranked = leaderboard.rebuild_leaderboard(db)
+    return {"status": "rebuilt", "ranked_users": ranked}
 
 @router.get("/global-stats")
 def get_global_stats(db: Session = Depends(database.get_db)):
@@ -53,6 +59,31 @@ def get_global_stats(db: Session = Depends(database.get_db)):
         "pass_rate": round(pass_rate, 1)
     }
 
+@router.get("/rate-limits")
+def get_rate_limits(current_admin: models.User = Depends(get_current_admin)):
+    """Current judge load, effective submission limits and recent throttle decisions"""
+    return submission_limiter.get_status()
+
+@router.get("/db-pool")
+def get_db_pool_stats(current_admin: models.User = Depends(get_current_admin)):
+    """Live database connection pool statistics (checked out, overflow, wait time)"""
+    return database.get_pool_stats()
+
+@router.get("/partitions")
+def get_partition_status(current_admin: models.User = Depends(get_current_admin)):
+    """Monthly partition maintenance settings and the last run's created/detached partitions"""
+    return partition_maintenance.stats()
+
+@router.get("/behavior-buffer")
+def get_behavior_buffer_stats(current_admin: models.User = Depends(get_current_admin)):
+    """Write-behind proctoring event buffer: buffered, written and flush counters"""
+    return behavior_buffer.stats()
+
+@router.get("/proctoring-rules")
+def get_proctoring_rules_stats(current_admin: models.User = Depends(get_current_admin)):
+    """Active proctoring rules, rule firings and violation counter persistence"""
+    return proctoring_rules.stats()
+
 def enrich_test_helper(test: models.ScheduledTest):
     from datetime import datetime
     now = datetime.now()
@@ -104,6 +135,7 @@ def create_test(test: schemas.TestCreate, db: Session = Depends(database.get_db)
     
     db.commit()
     db.refresh(new_test)
+    invalidation_bus.publish("test", new_test.id)
     return enrich_test_helper(new_test)
 
 @router.get("/tests", response_model=List[schemas.ScheduledTestResponse])
@@ -124,70 +156,113 @@ def create_test_problem(problem_data: dict, db: Session = Depends(database.get_d
             is_test_problem=True  # Mark as test-exclusive
         )
         db.add(db_problem)
-        db.commit()
-        db.refresh(db_problem)
+        db.flush() # Get ID
         
-        # Add test cases
-        for tc in problem_data.get("test_cases", []):
-            db_tc = models.TestCase(
-                problem_id=db_problem.id,
-                input_data=tc.get("input_data", ""),
-                expected_output=tc.get("expected_output", ""),
-                is_hidden=tc.get("is_hidden", False)
-            )
-            db.add(db_tc)
+        # Add test cases (one multi-row insert, same transaction)
+        test_cases.insert_test_cases(
+            db, models.TestCase, db_problem.id, problem_data.get("test_cases", []), default_hidden=False
+        )
         
         db.commit()
         db.refresh(db_problem)
+        invalidation_bus.publish("problem", db_problem.id)
         
         return {"id": db_problem.id, "title": db_problem.title, "status": "created"}
     except Exception as e:
         db.rollback()
         return {"error": str(e)}
 
+def build_test_results_query(test: models.ScheduledTest, problem_ids: List[int]):
+    """
+    One set-based query returning a row per non-admin student for a test:
+    attempts, problems solved (latest true submission per problem passed),
+    violation count, and enrollment/completion flags.
+    """
+    from sqlalchemy import func, case, and_, or_
+
+    Submission = models.Submission
+
+    # Submissions count for the test if tagged with it, or (fallback) made on its problems during the window.
+    # Window normalized for naive comparison
+    st_fallback = test.start_time.replace(tzinfo=None) if test.start_time.tzinfo else test.start_time
+    et_fallback = test.end_time.replace(tzinfo=None) if test.end_time.tzinfo else test.end_time
+
+    matches_test = Submission.test_id == test.id
+    if problem_ids:
+        matches_test = or_(
+            matches_test,
+            and_(
+                Submission.problem_id.in_(problem_ids),
+                Submission.created_at >= st_fallback,
+                Submission.created_at <= et_fallback
+            )
+        )
+
+    # Rank submissions per (user, problem, submission-vs-run) so rn = 1 is the latest of each kind
+    ranked = select(
+        Submission.user_id,
+        Submission.problem_id,
+        Submission.verdict,
+        Submission.is_test_submission,
+        func.row_number().over(
+            partition_by=(Submission.user_id, Submission.problem_id, Submission.is_test_submission),
+            order_by=(Submission.created_at.desc(), Submission.id.desc())
+        ).label("rn")
+    ).filter(matches_test).subquery("ranked")
+
+    # Scoring is based ONLY on the latest true submission for each problem,
+    # attempts count every submission and run
+    submission_stats = select(
+        ranked.c.user_id,
+        func.count().label("attempts"),
+        func.count(case((
+            and_(ranked.c.is_test_submission == True, ranked.c.rn == 1, ranked.c.verdict == "Passed"),
+            ranked.c.problem_id
+        ))).label("solved")
+    ).group_by(ranked.c.user_id).subquery("submission_stats")
+
+    # Maintained by the proctoring rules engine; at most one persist interval behind
+    violation_stats = select(
+        models.ViolationCounter.user_id,
+        func.sum(models.ViolationCounter.count).label("violations")
+    ).filter(models.ViolationCounter.test_id == test.id).group_by(models.ViolationCounter.user_id).subquery("violation_stats")
+
+    enrollment_stats = select(
+        models.TestEnrollment.user_id,
+        func.bool_or(models.TestEnrollment.status == "COMPLETED").label("completed")
+    ).filter(models.TestEnrollment.test_id == test.id).group_by(models.TestEnrollment.user_id).subquery("enrollment_stats")
+
+    return select(
+        models.User.id.label("user_id"),
+        models.User.username,
+        models.User.email,
+        func.coalesce(submission_stats.c.attempts, 0).label("attempts"),
+        func.coalesce(submission_stats.c.solved, 0).label("solved"),
+        func.coalesce(violation_stats.c.violations, 0).label("violations"),
+        enrollment_stats.c.user_id.isnot(None).label("enrolled"),
+        func.coalesce(enrollment_stats.c.completed, False).label("completed")
+    ).outerjoin(
+        submission_stats, submission_stats.c.user_id == models.User.id
+    ).outerjoin(
+        violation_stats, violation_stats.c.user_id == models.User.id
+    ).outerjoin(
+        enrollment_stats, enrollment_stats.c.user_id == models.User.id
+    ).filter(func.upper(models.User.role) != "ADMIN")
+
 @router.get("/test-results/{test_id}")
-def get_test_results(test_id: int, db: Session = Depends(database.get_db)):
+async def get_test_results(test_id: int, db: AsyncSession = Depends(database.get_async_db)):
     """Get all student results for a specific test (Admin only)"""
-    from sqlalchemy import func
-    
     # Get test details
-    test = db.query(models.ScheduledTest).filter(models.ScheduledTest.id == test_id).first()
+    test = (await db.execute(select(models.ScheduledTest).filter(models.ScheduledTest.id == test_id))).scalars().first()
     if not test:
         return {"error": "Test not found"}
     
     # Get all problems in this test
-    test_problems = db.query(models.TestProblem).filter(
+    problem_ids = (await db.execute(select(models.TestProblem.problem_id).filter(
         models.TestProblem.test_id == test_id
-    ).order_by(models.TestProblem.order).all()
-    
-    problem_ids = [tp.problem_id for tp in test_problems]
-    
-    # Get all participants - those enrolled, marked present, or with submissions/logs for this test
-    # Also fallback: anyone who submitted to these problems during the test window
-    enrolled_ids = [r[0] for r in db.query(models.TestEnrollment.user_id).filter(models.TestEnrollment.test_id == test_id).all()]
-    submission_ids = [r[0] for r in db.query(models.Submission.user_id).filter(models.Submission.test_id == test_id).all()]
-    behavior_ids = [r[0] for r in db.query(models.BehaviorLog.user_id).filter(models.BehaviorLog.test_id == test_id).all()]
-    
-    # Fallback for submissions during window - normalize for naive comparison
-    st_fallback = test.start_time.replace(tzinfo=None) if test.start_time.tzinfo else test.start_time
-    et_fallback = test.end_time.replace(tzinfo=None) if test.end_time.tzinfo else test.end_time
-    
-    fallback_ids = [r[0] for r in db.query(models.Submission.user_id).filter(
-        models.Submission.problem_id.in_(problem_ids),
-        models.Submission.created_at >= st_fallback,
-        models.Submission.created_at <= et_fallback
-    ).all()] if problem_ids else []
-
-    participant_ids = list(set(enrolled_ids + submission_ids + behavior_ids + fallback_ids))
+    ).order_by(models.TestProblem.order))).scalars().all()
     
-    # Also track who explicitly clicked "Finish Test"
-    completed_ids = [r[0] for r in db.query(models.TestEnrollment.user_id).filter(
-        models.TestEnrollment.test_id == test_id,
-        models.TestEnrollment.status == "COMPLETED"
-    ).all()]
-    
-    # Still get all non-admin users for the total list, but identify who participated
-    all_students = db.query(models.User).filter(func.upper(models.User.role) != "ADMIN").all()
+    rows = (await db.execute(build_test_results_query(test, problem_ids))).all()
     
     results = []
     participated_count = 0
@@ -195,63 +270,31 @@ def get_test_results(test_id: int, db: Session = Depends(database.get_db)):
     total_submissions_count = 0
     total_violations_count = 0
     total_completed_count = 0
+    total_p = len(problem_ids)
 
-    for student in all_students:
-        is_participant = student.id in participant_ids
-        
-        # Get submissions - FILTER FOR LATEST SUBMISSION PER PROBLEM
-        # We only want is_test_submission=True for actual scoring
-        all_subs = db.query(models.Submission).filter(
-            models.Submission.user_id == student.id,
-            (models.Submission.test_id == test_id) | 
-            (
-                models.Submission.problem_id.in_(problem_ids) & 
-                (models.Submission.created_at >= st_fallback) & 
-                (models.Submission.created_at <= et_fallback)
-            ) if problem_ids else (models.Submission.test_id == test_id)
-        ).order_by(models.Submission.created_at.desc()).all()
-
-        # Separate true submissions from runs
-        true_submissions = [s for s in all_subs if s.is_test_submission]
-        
-        # Deduplicate to get LATEST per problem
-        latest_true_subs = {}
-        for s in true_submissions:
-            if s.problem_id not in latest_true_subs:
-                latest_true_subs[s.problem_id] = s
-        
-        # Scoring is based ONLY on the latest true submission for each problem
-        solved_count = len([s for s in latest_true_subs.values() if s.verdict == "Passed"])
-        total_p = len(problem_ids)
-        score = (solved_count / total_p * 100) if total_p > 0 else 0
-        
-        # Count total ATTEMPTS (all submissions + runs) for the "Submissions" metric
-        total_attempts = len(all_subs)
-        
-        # Get violation count
-        violations = db.query(models.BehaviorLog).filter(
-            models.BehaviorLog.user_id == student.id,
-            models.BehaviorLog.test_id == test_id
-        ).count()
+    for row in rows:
+        # Participants: enrolled, or with submissions/logs for this test (including window fallback)
+        is_participant = bool(row.enrolled or row.attempts > 0 or row.violations > 0)
+        score = (row.solved / total_p * 100) if total_p > 0 else 0
 
         # Update aggregate stats if they actually did something or were enrolled
-        if is_participant or total_attempts > 0 or violations > 0:
+        if is_participant:
             participated_count += 1
             total_score_sum += score
-            total_submissions_count += total_attempts
-            total_violations_count += violations
-            if student.id in completed_ids:
+            total_submissions_count += row.attempts
+            total_violations_count += row.violations
+            if row.completed:
                 total_completed_count += 1
 
         results.append({
-            "user_id": student.id,
-            "username": student.username,
-            "email": student.email,
-            "solved": solved_count,
+            "user_id": row.user_id,
+            "username": row.username,
+            "email": row.email,
+            "solved": row.solved,
             "total_problems": total_p,
             "score": round(score, 2),
-            "violations": violations,
-            "submissions": total_attempts,
+            "violations": row.violations,
+            "submissions": row.attempts,
             "participated": is_participant
         })
     
@@ -271,82 +314,72 @@ def get_test_results(test_id: int, db: Session = Depends(database.get_db)):
     }
 
 @router.get("/test-results/{test_id}/export")
-def export_test_results_csv(test_id: int, db: Session = Depends(database.get_db)):
-    """Export test results as CSV"""
-    from fastapi.responses import Response
-    from sqlalchemy import func
+def export_test_results_csv(
+    test_id: int,
+    participants_only: bool = False,
+    completed_only: bool = False,
+    min_score: Optional[float] = None,
+    db: Session = Depends(database.get_db)
+):
+    """Export test results as CSV (streamed row by row from a server-side cursor)"""
+    from fastapi.responses import StreamingResponse
+    from sqlalchemy import or_
     import csv
     import io
     
-    # Get test data (reuse logic from get_test_results)
     test = db.query(models.ScheduledTest).filter(models.ScheduledTest.id == test_id).first()
     if not test:
         return {"error": "Test not found"}
     
-    test_problems = db.query(models.TestProblem).filter(
+    problem_ids = [r[0] for r in db.query(models.TestProblem.problem_id).filter(
         models.TestProblem.test_id == test_id
-    ).order_by(models.TestProblem.order).all()
-    
-    problem_ids = [tp.problem_id for tp in test_problems]
-    
-    # Get all participants
-    enrolled_ids = [r[0] for r in db.query(models.TestEnrollment.user_id).filter(models.TestEnrollment.test_id == test_id).all()]
-    submission_ids = [r[0] for r in db.query(models.Submission.user_id).filter(models.Submission.test_id == test_id).all()]
-    behavior_ids = [r[0] for r in db.query(models.BehaviorLog.user_id).filter(models.BehaviorLog.test_id == test_id).all()]
-    
-    st_fallback = test.start_time
-    et_fallback = test.end_time
-    fallback_ids = [r[0] for r in db.query(models.Submission.user_id).filter(
-        models.Submission.problem_id.in_(problem_ids),
-        models.Submission.created_at >= st_fallback,
-        models.Submission.created_at <= et_fallback
-    ).all()] if problem_ids else []
-
-    participant_ids = list(set(enrolled_ids + submission_ids + behavior_ids + fallback_ids))
-    all_students = db.query(models.User).filter(func.upper(models.User.role) != "ADMIN").all()
-    
-    # Prepare CSV
-    output = io.StringIO()
-    writer = csv.writer(output)
+    ).order_by(models.TestProblem.order).all()]
+    total_problems = len(problem_ids)
     
-    # Header
-    writer.writerow(["Student ID", "Username", "Email", "Solved", "Total Problems", "Score (%)", "Violations", "Total Submissions"])
+    results = build_test_results_query(test, problem_ids).subquery("results")
+    query = select(results).order_by(results.c.user_id)
+    if participants_only:
+        query = query.filter(or_(results.c.enrolled, results.c.attempts > 0, results.c.violations > 0))
+    if completed_only:
+        query = query.filter(results.c.completed == True)
+    if min_score is not None and total_problems > 0:
+        query = query.filter(results.c.solved * 100.0 / total_problems >= min_score)
     
-    # Data rows
-    for student in all_students:
-        submissions = db.query(models.Submission).filter(
-            models.Submission.user_id == student.id,
-            (models.Submission.test_id == test_id) | 
-            (
-                models.Submission.problem_id.in_(problem_ids) & 
-                (models.Submission.created_at >= st_fallback) & 
-                (models.Submission.created_at <= et_fallback)
-            ) if problem_ids else (models.Submission.test_id == test_id)
-        ).all()
+    def generate_rows():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
         
-        violations = db.query(models.BehaviorLog).filter(
-            models.BehaviorLog.user_id == student.id,
-            models.BehaviorLog.test_id == test_id
-        ).count()
+        def flush():
+            data = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            return data
         
-        solved = len([s for s in submissions if s.verdict == "Passed"])
-        total_problems = len(problem_ids)
-        score = (solved / total_problems * 100) if total_problems > 0 else 0
+        # Header
+        writer.writerow(["Student ID", "Username", "Email", "Solved", "Total Problems", "Score (%)", "Violations", "Total Submissions"])
+        yield flush()
         
-        writer.writerow([
-            student.id,
-            student.username,
-            student.email,
-            solved,
-            total_problems,
-            round(score, 2),
-            violations,
-            len(submissions)
-        ])
+        # The request session may be closed before the body is sent, so the stream owns its session
+        stream_db = database.SessionLocal()
+        try:
+            for row in stream_db.execute(query.execution_options(yield_per=500)):
+                score = (row.solved / total_problems * 100) if total_problems > 0 else 0
+                writer.writerow([
+                    row.user_id,
+                    row.username,
+                    row.email,
+                    row.solved,
+                    total_problems,
+                    round(score, 2),
+                    row.violations,
+                    row.attempts
+                ])
+                yield flush()
+        finally:
+            stream_db.close()
     
-    output.seek(0)
-    return Response(
-        content=output.getvalue(),
+    return StreamingResponse(
+        generate_rows(),
         media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename=test_{test_id}_results.csv"}
     )
@@ -4,6 +4,8 @@ from app.db import database
 from app.models import models
 from app.schemas import schemas
 from app.services.compiler import CodeExecutor
+from app.services.rate_limiter import submission_limiter
+from app.services import code_store, leaderboard, user_stats
 from app.api.deps import get_current_user
 import json
 
@@ -31,21 +33,25 @@ def execute_code(
         })
     
     # 3. Run Code
-    if request.language == "javascript":
-        result = executor.run_javascript(request.code, test_cases_dicts)
-    elif request.language == "python":
-        result = executor.run_python(request.code, test_cases_dicts)
-    else:
+    if request.language not in ("javascript", "python"):
         raise HTTPException(status_code=400, detail="Unsupported language")
+
+    with submission_limiter.track_judge():
+        if request.language == "javascript":
+            result = executor.run_javascript(request.code, test_cases_dicts)
+        else:
+            result = executor.run_python(request.code, test_cases_dicts)
     
     # 4. Record Submission
     user_id = current_user.id 
+    passed = result["verdict"] == "Passed"
+    first_solve = passed and user_stats.claim_first_solve(db, user_id, "TEST", problem.id)
     
     submission = models.Submission(
         user_id=user_id,
         problem_id=problem.id,
         test_id=request.test_id,
-        code=request.code,
+        code_sha256=code_store.put(db, request.code),
         verdict=result["verdict"],
         passed_cases=result["passed_cases"],
         total_cases=result["total_cases"],
@@ -54,6 +60,9 @@ def execute_code(
         is_test_submission=request.is_test_submission
     )
     db.add(submission)
+    user_stats.record_attempt(db, user_id, passed, first_solve)
+    if passed:
+        leaderboard.record_pass(db, current_user)
     db.commit()
     
     return result
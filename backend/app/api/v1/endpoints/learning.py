@@ -1,14 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import func, literal, select, union_all, update
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from datetime import datetime
 
 from app.db import database
-from app.models.learning import Course, CourseProblem, UserCourseProgress, SubmissionLog
+from app.models.learning import Course, CourseProblem, CourseProblemTestCase, UserCourseProgress, SubmissionLog
 from app.models.models import User
-from app.api.deps import get_current_user
+from app.api.deps import get_current_user, get_current_user_async
 from app.services.secure_executor import CodeExecutor
 from app.services.rate_limiter import submission_limiter
+from app.services import user_stats
+from app.services.course_catalog import courses_with_progress_query, catalog_cache
 
 router = APIRouter()
 
@@ -17,36 +22,114 @@ router = APIRouter()
 # ACCESS CONTROL UTILITIES
 # ============================================================================
 
-def get_or_create_progress(user_id: int, course_id: int, db: Session) -> UserCourseProgress:
+def get_or_create_progress(user_id: int, course_id: int, db: Session):
     """
     Get user's progress for a course, or create if first access.
     Initial current_step = 1 (user can access step 1).
+    
+    The common case is a single plain read. Only when no row exists does it
+    run INSERT ... ON CONFLICT DO NOTHING RETURNING (unioned with a re-read),
+    so concurrent first visits cannot collide and page views do not burn
+    user_course_progress id sequence values. Only a first visit commits.
+    
+    Returns a row with id, current_step and created.
     """
-    progress = db.query(UserCourseProgress).filter(
+    existing = select(
+        UserCourseProgress.id, UserCourseProgress.current_step, literal(False).label("created")
+    ).filter(
         UserCourseProgress.user_id == user_id,
         UserCourseProgress.course_id == course_id
+    )
+    progress = db.execute(existing).first()
+    if progress is not None:
+        return progress
+    
+    inserted = insert(UserCourseProgress).values(
+        user_id=user_id,
+        course_id=course_id,
+        current_step=1  # Start at step 1
+    ).on_conflict_do_nothing(
+        index_elements=[UserCourseProgress.user_id, UserCourseProgress.course_id]
+    ).returning(UserCourseProgress.id, UserCourseProgress.current_step).cte("inserted")
+    
+    progress = db.execute(
+        union_all(select(inserted.c.id, inserted.c.current_step, literal(True).label("created")), existing)
     ).first()
     
-    if not progress:
-        progress = UserCourseProgress(
-            user_id=user_id,
-            course_id=course_id,
-            current_step=1  # Start at step 1
-        )
-        db.add(progress)
+    if progress is None:
+        # Lost a race with a concurrent first visit that committed after our snapshot
+        progress = db.execute(existing).first()
+    elif progress.created:
         db.commit()
-        db.refresh(progress)
     
     return progress
 
 
-def validate_problem_access(
-    user_id: int,
-    problem: CourseProblem,
-    db: Session
-) -> tuple[bool, str]:
+def load_submission_context(user_id: int, problem_id: int, db: Session):
+    """
+    Everything submit_solution needs in one query: the problem, its course,
+    the user's progress row, the problem's test cases and the course's step
+    count.
+    
+    No row lock is taken: judging can take seconds, and holding a lock (and a
+    pooled connection waiting on it) for that long would let parallel submits
+    pile up. submit_solution instead advances the step with a conditional
+    UPDATE, so concurrent submissions cannot double-increment it. Only a
+    learner's first submission to a course needs extra statements (to create
+    and commit the progress row).
+    
+    Returns (problem, course, progress, test_cases, total_steps), or None if
+    the problem does not exist.
+    """
+    test_cases = select(
+        func.json_agg(aggregate_order_by(
+            func.json_build_object(
+                "input_data", CourseProblemTestCase.input_data,
+                "expected_output", CourseProblemTestCase.expected_output
+            ),
+            CourseProblemTestCase.id
+        ))
+    ).filter(CourseProblemTestCase.problem_id == CourseProblem.id).scalar_subquery()
+    
+    total_steps = select(func.count(CourseProblem.id)).filter(
+        CourseProblem.course_id == Course.id
+    ).correlate(Course).scalar_subquery()
+    
+    query = select(
+        CourseProblem,
+        Course,
+        UserCourseProgress,
+        test_cases.label("test_cases"),
+        total_steps.label("total_steps")
+    ).join(
+        Course, Course.id == CourseProblem.course_id
+    ).join(
+        UserCourseProgress,
+        (UserCourseProgress.course_id == CourseProblem.course_id) & (UserCourseProgress.user_id == user_id)
+    ).filter(CourseProblem.id == problem_id)
+    
+    row = db.execute(query).first()
+    if row is None:
+        # First submission to this course (or unknown problem): create the progress row and retry
+        db.execute(
+            insert(UserCourseProgress).from_select(
+                ["user_id", "course_id", "current_step"],
+                select(literal(user_id), CourseProblem.course_id, literal(1)).filter(CourseProblem.id == problem_id)
+            ).on_conflict_do_nothing(index_elements=[UserCourseProgress.user_id, UserCourseProgress.course_id])
+        )
+        # Commit right away so the new row is not held locked while the code is judged
+        db.commit()
+        row = db.execute(query).first()
+        if row is None:
+            return None
+    
+    problem, course, progress, cases, steps = row
+    return problem, course, progress, cases or [], steps
+
+
+def validate_problem_access(step_number: int, progress) -> tuple[bool, str]:
     """
-    Validate if user can access a specific problem.
+    Validate if user can access a specific problem (given its step and the user's progress).
     
     Returns: (is_allowed, reason_if_denied)
     
@@ -54,19 +137,13 @@ def validate_problem_access(
     - User can access problem if problem.step_number <= current_step
     - If problem.step_number > current_step, access is DENIED
     """
-    progress = get_or_create_progress(user_id, problem.course_id, db)
-    
-    if problem.step_number > progress.current_step:
-        return False, f"Step {problem.step_number} is locked. Complete step {progress.current_step} first."
+    if step_number > progress.current_step:
+        return False, f"Step {step_number} is locked. Complete step {progress.current_step} first."
     
     return True, ""
 
 
-def can_submit_to_step(
-    user_id: int,
-    problem: CourseProblem,
-    db: Session
-) -> tuple[bool, str]:
+def can_submit_to_step(problem: CourseProblem, progress) -> tuple[bool, str]:
     """
     Validate if user can SUBMIT to a specific step.
     
@@ -77,8 +154,6 @@ def can_submit_to_step(
     - Cannot re-submit to already completed steps (step < current_step)
     - Cannot skip ahead (step > current_step)
     """
-    progress = get_or_create_progress(user_id, problem.course_id, db)
-    
     if problem.step_number < progress.current_step:
         return False, f"Step {problem.step_number} is already completed. You are on step {progress.current_step}."
     
@@ -94,9 +169,9 @@ def can_submit_to_step(
 # ============================================================================
 
 @router.get("/courses")
-def list_courses(
-    db: Session = Depends(database.get_db),
-    current_user: User = Depends(get_current_user)
+async def list_courses(
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: User = Depends(get_current_user_async)
 ):
     """
     List all active courses.
@@ -107,22 +182,12 @@ def list_courses(
     
     No access control needed - listing is public.
     """
-    courses = db.query(Course).filter(Course.is_active == True).all()
+    rows = (await db.execute(courses_with_progress_query(current_user.id))).all()
     
     result = []
-    for course in courses:
-        # Get user's progress for this course (if any)
-        progress = db.query(UserCourseProgress).filter(
-            UserCourseProgress.user_id == current_user.id,
-            UserCourseProgress.course_id == course.id
-        ).first()
-        
-        # Count total problems in course
-        total_problems = db.query(CourseProblem).filter(
-            CourseProblem.course_id == course.id
-        ).count()
-        
-        completed_steps = max(0, progress.current_step - 1) if progress else 0
+    for course, current_step, total_problems in rows:
+        is_started = current_step is not None
+        completed_steps = max(0, current_step - 1) if is_started else 0
         percentage = round((completed_steps / total_problems * 100), 1) if total_problems > 0 else 0
         
         result.append({
@@ -132,11 +197,11 @@ def list_courses(
             "level_order": course.level_order,
             "editor_language": course.editor_language,
             "progress": {
-                "current_step": progress.current_step if progress else 1,
+                "current_step": current_step if is_started else 1,
                 "total_steps": total_problems,
                 "percentage_complete": percentage,
-                "is_started": progress is not None,
-                "is_completed": progress.current_step > total_problems if progress else False
+                "is_started": is_started,
+                "is_completed": current_step > total_problems if is_started else False
             }
         })
     
@@ -164,53 +229,52 @@ def get_course_problems(
     - Shows which step is current
     - Prevents information leakage
     """
-    # Verify course exists
-    course = db.query(Course).filter(Course.id == course_id).first()
-    if not course:
+    # Verify course exists (course and ordered steps come from the catalog cache)
+    entry = catalog_cache.get_course(db, course_id)
+    if not entry:
         raise HTTPException(status_code=404, detail="Course not found")
+    course = entry["course"]
     
-    if not course.is_active:
+    if not course["is_active"]:
         raise HTTPException(status_code=403, detail="Course is not active")
     
     # Get or create user's progress
     progress = get_or_create_progress(current_user.id, course_id, db)
     
-    # Get all problems ordered by step_number
-    problems = db.query(CourseProblem).filter(
-        CourseProblem.course_id == course_id
-    ).order_by(CourseProblem.step_number).all()
+    # All problems, ordered by step_number
+    problems = entry["steps"]
     
     result = []
     for problem in problems:
         # Determine access status
-        if problem.step_number < progress.current_step:
+        if problem["step_number"] < progress.current_step:
             access_status = "completed"
-        elif problem.step_number == progress.current_step:
+        elif problem["step_number"] == progress.current_step:
             access_status = "current"
         else:
             access_status = "locked"
         
         # Only include sensitive data if accessible
-        is_accessible = problem.step_number <= progress.current_step
+        is_accessible = problem["step_number"] <= progress.current_step
         
         result.append({
-            "id": problem.id,
-            "step_number": problem.step_number,
-            "title": problem.title,
+            "id": problem["id"],
+            "step_number": problem["step_number"],
+            "title": problem["title"],
             "access_status": access_status,
             # Conditional fields - only if accessible
-            "description": problem.description if is_accessible else None,
-            "starter_code": problem.starter_code if is_accessible else None,
+            "description": problem["description"] if is_accessible else None,
+            "starter_code": problem["starter_code"] if is_accessible else None,
             # Never expose solution code
-            "created_at": problem.created_at.isoformat() if is_accessible else None
+            "created_at": problem["created_at"].isoformat() if is_accessible and problem["created_at"] else None
         })
     
     return {
         "course": {
-            "id": course.id,
-            "language": course.language,
-            "level": course.level,
-            "editor_language": course.editor_language
+            "id": course["id"],
+            "language": course["language"],
+            "level": course["level"],
+            "editor_language": course["editor_language"]
         },
         "progress": {
             "current_step": progress.current_step,
@@ -240,41 +304,43 @@ def get_problem(
     - Returns 403 if user tries to access future step
     - Prevents direct URL bypass
     """
-    problem = db.query(CourseProblem).filter(CourseProblem.id == problem_id).first()
-    if not problem:
+    cached = catalog_cache.get_step(db, problem_id)
+    if not cached:
         raise HTTPException(status_code=404, detail="Problem not found")
+    entry, problem = cached
+    course = entry["course"]
     
     # Verify course is active
-    if not problem.course.is_active:
+    if not course["is_active"]:
         raise HTTPException(status_code=403, detail="Course is not active")
     
+    # Get user's progress (once per request)
+    progress = get_or_create_progress(current_user.id, problem["course_id"], db)
+    
     # ACCESS CONTROL: Check if user can access this step
-    is_allowed, reason = validate_problem_access(current_user.id, problem, db)
+    is_allowed, reason = validate_problem_access(problem["step_number"], progress)
     if not is_allowed:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail=reason
         )
     
-    # Get user's progress
-    progress = get_or_create_progress(current_user.id, problem.course_id, db)
-    
     return {
-        "id": problem.id,
-        "course_id": problem.course_id,
-        "step_number": problem.step_number,
-        "title": problem.title,
-        "description": problem.description,
-        "starter_code": problem.starter_code,
+        "id": problem["id"],
+        "course_id": problem["course_id"],
+        "step_number": problem["step_number"],
+        "title": problem["title"],
+        "description": problem["description"],
+        "starter_code": problem["starter_code"],
         "course": {
-            "id": problem.course.id,
-            "language": problem.course.language,
-            "editor_language": problem.course.editor_language
+            "id": course["id"],
+            "language": course["language"],
+            "editor_language": course["editor_language"]
         },
         "progress": {
             "current_step": progress.current_step,
-            "is_current": problem.step_number == progress.current_step,
-            "is_completed": problem.step_number < progress.current_step
+            "is_current": problem["step_number"] == progress.current_step,
+            "is_completed": problem["step_number"] < progress.current_step
         }
         # NOTE: solution_code is NEVER returned
     }
@@ -307,16 +373,19 @@ def submit_solution(
     - On failed submission:
       * No progress change
       * User can retry same step
+    - Payload size and rate limits are checked before any database work
+    - Judging runs without holding a lock on the progress row; the step is
+      advanced with UPDATE ... WHERE current_step = <step judged>, so parallel
+      correct submissions for the same step advance it once and each reports
+      the learner's resulting current_step
     
     Error cases:
     - 403: Trying to submit to wrong step
     - 404: Problem not found
     - 400: Invalid submission format
+    - 413: Code over 64KB
+    - 429: Rate limited
     """
-    problem = db.query(CourseProblem).filter(CourseProblem.id == problem_id).first()
-    if not problem:
-        raise HTTPException(status_code=404, detail="Problem not found")
-    
     # Validate submission format
     if not submission or "code" not in submission:
         raise HTTPException(status_code=400, detail="Missing 'code' in submission")
@@ -325,14 +394,6 @@ def submit_solution(
     if not code or not isinstance(code, str):
         raise HTTPException(status_code=400, detail="Invalid code format")
     
-    # ACCESS CONTROL: Check if user can SUBMIT to this step
-    is_allowed, reason = can_submit_to_step(current_user.id, problem, db)
-    if not is_allowed:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=reason
-        )
-    
     # 1. Payload Size Validation (64KB cap)
     payload_size = len(code.encode('utf-8'))
     if payload_size > 65536:
@@ -341,17 +402,24 @@ def submit_solution(
             detail="Payload too large. Code must be under 64KB."
         )
 
-    # Get user's progress (guaranteed to exist after can_submit_to_step)
-    progress = db.query(UserCourseProgress).filter(
-        UserCourseProgress.user_id == current_user.id,
-        UserCourseProgress.course_id == problem.course_id
-    ).first()
-    
-    # Rate limiting check (Phase 7: Abuse Prevention)
+    # Rate limiting check (Phase 7: Abuse Prevention), before any database work
     submission_limiter.check_rate_limit(current_user.id)
     
+    # Problem, course, test cases, step count and progress in one round trip
+    context = load_submission_context(current_user.id, problem_id, db)
+    if not context:
+        raise HTTPException(status_code=404, detail="Problem not found")
+    problem, course, progress, db_test_cases, total_problems = context
+    
+    # ACCESS CONTROL: Check if user can SUBMIT to this step
+    is_allowed, reason = can_submit_to_step(problem, progress)
+    if not is_allowed:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=reason
+        )
+    
     executor = CodeExecutor()
-    course = problem.course
     
     # 2. Logic Verification (Anti-Cheating SLV)
     is_logic_valid, logic_error = executor.verify_logic(
@@ -369,19 +437,18 @@ def submit_solution(
             },
             "execution": {
                 "passed_cases": 0,
-                "total_cases": len(problem.test_cases) or 1,
+                "total_cases": len(db_test_cases) or 1,
                 "execution_time": 0.0,
                 "output": f"Logic Analysis Failure: {logic_error}"
             }
         }
 
-    # Get real test cases from DB
-    db_test_cases = problem.test_cases
+    # Real test cases from DB (loaded with the submission context)
     if db_test_cases:
         test_cases = [
             {
-                "input_data": tc.input_data or "",
-                "expected_output": tc.expected_output.strip()
+                "input_data": tc["input_data"] or "",
+                "expected_output": tc["expected_output"].strip()
             }
             for tc in db_test_cases
         ]
@@ -395,35 +462,37 @@ def submit_solution(
         ]
     
     # Execute based on course language
-    if course.editor_language == "python":
-        result = executor.execute_python(code, test_cases)
-    elif course.editor_language == "javascript":
-        result = executor.execute_javascript(code, test_cases)
-    elif course.editor_language == "java":
-        result = executor.execute_java(code, test_cases)
-    elif course.editor_language == "cpp":
-        result = executor.execute_cpp(code, test_cases)
-    elif course.editor_language == "c":
-        result = executor.execute_c(code, test_cases)
-    elif course.editor_language == "csharp":
-        result = executor.execute_csharp(code, test_cases)
-    elif course.editor_language == "go":
-        result = executor.execute_go(code, test_cases)
-    elif course.editor_language == "rust":
-        result = executor.execute_rust(code, test_cases)
-    elif course.editor_language == "typescript":
-        result = executor.execute_typescript(code, test_cases)
-    elif course.editor_language == "php":
-        result = executor.execute_php(code, test_cases)
-    elif course.editor_language == "kotlin":
-        result = executor.execute_kotlin(code, test_cases)
-    else:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Unsupported language: {course.editor_language}"
-        )
+    with submission_limiter.track_judge():
+        if course.editor_language == "python":
+            result = executor.execute_python(code, test_cases)
+        elif course.editor_language == "javascript":
+            result = executor.execute_javascript(code, test_cases)
+        elif course.editor_language == "java":
+            result = executor.execute_java(code, test_cases)
+        elif course.editor_language == "cpp":
+            result = executor.execute_cpp(code, test_cases)
+        elif course.editor_language == "c":
+            result = executor.execute_c(code, test_cases)
+        elif course.editor_language == "csharp":
+            result = executor.execute_csharp(code, test_cases)
+        elif course.editor_language == "go":
+            result = executor.execute_go(code, test_cases)
+        elif course.editor_language == "rust":
+            result = executor.execute_rust(code, test_cases)
+        elif course.editor_language == "typescript":
+            result = executor.execute_typescript(code, test_cases)
+        elif course.editor_language == "php":
+            result = executor.execute_php(code, test_cases)
+        elif course.editor_language == "kotlin":
+            result = executor.execute_kotlin(code, test_cases)
+        else:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Unsupported language: {course.editor_language}"
+            )
     
     is_correct = result["verdict"] == "Passed"
+    first_solve = is_correct and user_stats.claim_first_solve(db, current_user.id, "LEARNING", problem_id)
     
     # 2. Submission Logging (Phase 9: Final Implementation)
     log = SubmissionLog(
@@ -435,30 +504,37 @@ def submit_solution(
         payload_size=payload_size
     )
     db.add(log)
+    user_stats.record_attempt(db, current_user.id, is_correct, first_solve)
     
     # Log result to rate limiter for abuse tracking
     submission_limiter.log_result(current_user.id, is_correct)
     
     if is_correct:
-        # SUCCESS: Increment current_step
+        # SUCCESS: Increment current_step, only if no concurrent submission already did
         old_step = progress.current_step
-        progress.current_step += 1
-        progress.updated_at = datetime.now()
+        new_step = db.execute(
+            update(UserCourseProgress)
+            .where(UserCourseProgress.id == progress.id, UserCourseProgress.current_step == old_step)
+            .values(current_step=UserCourseProgress.current_step + 1, updated_at=datetime.now())
+            .returning(UserCourseProgress.current_step)
+            .execution_options(synchronize_session=False)
+        ).scalar()
+        if new_step is None:
+            # A parallel submission completed this step first; report where the learner is now
+            new_step = db.execute(
+                select(UserCourseProgress.current_step).filter(UserCourseProgress.id == progress.id)
+            ).scalar()
         db.commit()
         
         # Check if course is complete
-        total_problems = db.query(CourseProblem).filter(
-            CourseProblem.course_id == problem.course_id
-        ).count()
-        
-        is_course_complete = progress.current_step > total_problems
+        is_course_complete = new_step > total_problems
         
         return {
             "success": True,
             "message": "Correct! Step completed.",
             "progress": {
                 "completed_step": old_step,
-                "current_step": progress.current_step,
+                "current_step": new_step,
                 "is_course_complete": is_course_complete
             },
             "execution": {
@@ -471,6 +547,7 @@ def submit_solution(
         }
     else:
         # FAILURE: No progress change, user can retry
+        db.commit()  # persist the attempt log
         return {
             "success": False,
             "message": "Incorrect solution. Try again.",
@@ -504,15 +581,14 @@ def get_progress(
     - Total steps
     - Percentage complete
     """
-    course = db.query(Course).filter(Course.id == course_id).first()
-    if not course:
+    entry = catalog_cache.get_course(db, course_id)
+    if not entry:
         raise HTTPException(status_code=404, detail="Course not found")
+    course = entry["course"]
     
     progress = get_or_create_progress(current_user.id, course_id, db)
     
-    total_problems = db.query(CourseProblem).filter(
-        CourseProblem.course_id == course_id
-    ).count()
+    total_problems = len(entry["steps"])
     
     completed_steps = max(0, progress.current_step - 1)  # current_step is next to do
     percentage = round((completed_steps / total_problems * 100), 1) if total_problems > 0 else 0
@@ -520,8 +596,8 @@ def get_progress(
     return {
         "course_id": course_id,
         "course_id": course_id,
-        "language": course.language,
-        "level": course.level,
+        "language": course["language"],
+        "level": course["level"],
         "current_step": progress.current_step,
         "completed_steps": completed_steps,
         "total_steps": total_problems,
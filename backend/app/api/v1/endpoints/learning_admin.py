@@ -1,6 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import case, func, text, tuple_, update
 from typing import Optional
 from datetime import datetime
 
@@ -8,8 +10,12 @@ from app.db import database
 from app.models.learning import Course, CourseProblem, UserCourseProgress, CourseProblemTestCase, AdminAuditLog
 from app.models.models import User
 from app.api.deps import get_current_admin
-from app.services.audit import log_admin_action
+from app.services.audit import audit_log_page, log_admin_action
 from app.schemas.learning import TestCaseRequest, TestCaseResponse
+from app.services.course_catalog import catalog_cache
+from app.services.course_import import CourseImporter, ImportFormatError, iter_json_steps, iter_jsonl_steps
+from app.services.invalidation_bus import invalidation_bus
+from app.services.platform_stats import platform_stats
 
 router = APIRouter()
 
@@ -131,14 +137,16 @@ def create_course(
         is_active=True
     )
     db.add(course)
-    db.commit()
-    db.refresh(course)
+    db.flush() # Get ID
     
-    # Audit log
+    # Audit log (same transaction)
     log_admin_action(
         db, admin.id, "CREATE_COURSE", "course", course.id,
         new_value={"language": course.language, "editor_language": course.editor_language}
     )
+    db.commit()
+    db.refresh(course)
+    invalidation_bus.publish("course", course.id)
     
     return {
         "id": course.id,
@@ -161,10 +169,11 @@ def activate_course(
         raise HTTPException(status_code=404, detail="Course not found")
     
     course.is_active = True
-    db.commit()
     
-    # Audit log
+    # Audit log (same transaction)
     log_admin_action(db, admin.id, "ACTIVATE_COURSE", "course", course_id)
+    db.commit()
+    invalidation_bus.publish("course", course_id)
     
     return {"message": f"Course '{course.language}' activated", "is_active": True}
 
@@ -185,10 +194,11 @@ def deactivate_course(
         raise HTTPException(status_code=404, detail="Course not found")
     
     course.is_active = False
-    db.commit()
     
-    # Audit log
+    # Audit log (same transaction)
     log_admin_action(db, admin.id, "DEACTIVATE_COURSE", "course", course_id)
+    db.commit()
+    invalidation_bus.publish("course", course_id)
     
     return {"message": f"Course '{course.language}' deactivated", "is_active": False}
 
@@ -323,14 +333,16 @@ def add_problem(
     )
     
     db.add(problem)
-    db.commit()
-    db.refresh(problem)
+    db.flush() # Get ID
     
-    # Audit log
+    # Audit log (same transaction)
     log_admin_action(
         db, admin.id, "ADD_PROBLEM", "problem", problem.id,
         new_value={"course_id": course_id, "step_number": step_number, "title": problem.title, "validation_policy": problem.validation_policy}
     )
+    db.commit()
+    db.refresh(problem)
+    invalidation_bus.publish("course", course_id)
     
     return {
         "id": problem.id,
@@ -393,15 +405,15 @@ def update_problem(
             detail="Cannot change course_id or step_number. Use reorder endpoint for step changes."
         )
     
-    db.commit()
-    db.refresh(problem)
-    
-    # Audit log
+    # Audit log (same transaction)
     log_admin_action(
         db, admin.id, "UPDATE_PROBLEM", "problem", problem_id,
         old_value=old_values,
         new_value=problem_data
     )
+    db.commit()
+    db.refresh(problem)
+    invalidation_bus.publish("course", problem.course_id)
     
     return {
         "id": problem.id,
@@ -464,13 +476,14 @@ def delete_problem(
     step_number = problem.step_number
     
     db.delete(problem)
-    db.commit()
     
-    # Audit log
+    # Audit log (same transaction)
     log_admin_action(
         db, admin.id, "DELETE_PROBLEM", "problem", problem_id,
         old_value={"course_id": course_id, "step_number": step_number, "force": force}
     )
+    db.commit()
+    invalidation_bus.publish("course", course_id)
     
     return {
         "message": f"Problem at step {step_number} deleted",
@@ -508,14 +521,13 @@ def reorder_steps(
     if not mappings:
         raise HTTPException(status_code=400, detail="No mappings provided")
     
-    # Validate all problems exist and belong to course
+    # Validate all problems exist and belong to course (locked until commit)
     problem_ids = [m["problem_id"] for m in mappings]
-    problems = db.query(CourseProblem).filter(
-        CourseProblem.id.in_(problem_ids),
+    course_steps = dict(db.query(CourseProblem.id, CourseProblem.step_number).filter(
         CourseProblem.course_id == course_id
-    ).all()
+    ).with_for_update().all())
     
-    if len(problems) != len(problem_ids):
+    if len(set(problem_ids)) != len(problem_ids) or any(pid not in course_steps for pid in problem_ids):
         raise HTTPException(status_code=400, detail="Some problems not found or don't belong to this course")
     
     # Validate new step numbers
@@ -534,32 +546,55 @@ def reorder_steps(
             detail=f"Step sequence must be continuous. Expected {expected}, got {new_steps_sorted}"
         )
     
+    new_step_by_id = {m["problem_id"]: m["new_step"] for m in mappings}
+    
     # Apply changes (atomic)
     try:
-        # First pass: Move to temporary large values to avoid unique constraint violations
-        for mapping in mappings:
-            problem = db.query(CourseProblem).filter(
-                CourseProblem.id == mapping["problem_id"]
-            ).first()
-            # Temporary value = new_step + 1000 (enough to avoid existing steps)
-            problem.step_number = mapping["new_step"] + 1000
-        
-        db.flush() # Ensure temp values are flushed
-        
-        # Second pass: Move to final values
-        for mapping in mappings:
-            problem = db.query(CourseProblem).filter(
-                CourseProblem.id == mapping["problem_id"]
-            ).first()
-            problem.step_number = mapping["new_step"]
+        # unique_course_step is checked row by row, so park the moved steps on
+        # negative numbers first, then flip them back: two statements in total
+        db.execute(
+            update(CourseProblem)
+            .where(CourseProblem.id.in_(problem_ids))
+            .values(step_number=-case(new_step_by_id, value=CourseProblem.id))
+            .execution_options(synchronize_session=False)
+        )
+        db.execute(
+            update(CourseProblem)
+            .where(CourseProblem.course_id == course_id, CourseProblem.step_number < 0)
+            .values(step_number=-CourseProblem.step_number)
+            .execution_options(synchronize_session=False)
+        )
         
-        db.commit()
+        # Learners have completed every step before current_step in the old order.
+        # Resume them at the earliest step (new order) among the ones they had not
+        # completed, so nobody skips a step; finished learners are left alone.
+        # Step numbers can have gaps (deleted steps), so bounds come from the
+        # highest step number rather than the step count.
+        old_steps = list(course_steps.values())
+        moved_steps = [new_step_by_id.get(pid, step) for pid, step in course_steps.items()]
+        progress_shift = db.execute(text("""
+            UPDATE user_course_progress p
+            SET current_step = COALESCE(
+                (SELECT min(m.new_step)
+                 FROM unnest(CAST(:old_steps AS integer[]), CAST(:new_steps AS integer[])) AS m(old_step, new_step)
+                 WHERE m.old_step >= p.current_step),
+                :new_last_step + 1
+            )
+            WHERE p.course_id = :course_id AND p.current_step <= :old_last_step"""), {
+            "old_steps": old_steps,
+            "new_steps": moved_steps,
+            "old_last_step": max(old_steps),
+            "new_last_step": max(moved_steps),
+            "course_id": course_id
+        })
         
-        # Audit log
+        # Audit log (same transaction)
         log_admin_action(
             db, admin.id, "REORDER_STEPS", "course", course_id,
-            new_value={"mappings": mappings}
+            new_value={"mappings": mappings, "progress_rows_updated": progress_shift.rowcount}
         )
+        db.commit()
+        invalidation_bus.publish("course", course_id)
         
         return {
             "message": f"Reordered {len(mappings)} problems successfully",
@@ -576,11 +611,58 @@ def reorder_steps(
 # BULK UPLOAD MANAGEMENT
 # ============================================================================
 
+async def _run_course_import(
+    db: AsyncSession,
+    course_id: int,
+    steps,
+    admin: User,
+    dry_run: bool
+) -> dict:
+    """Feed steps (sync or async iterable) through the importer in one transaction."""
+    course = await db.get(Course, course_id)
+    if not course:
+        raise HTTPException(status_code=404, detail="Course not found")
+
+    importer = CourseImporter(db, course_id, dry_run=dry_run)
+    try:
+        if hasattr(steps, "__aiter__"):
+            async for step in steps:
+                await importer.add(step)
+        else:
+            for step in steps:
+                await importer.add(step)
+        report = await importer.finish()
+
+        if dry_run:
+            await db.rollback()
+            return report
+
+        log_admin_action(
+            db, admin.id, "BULK_UPLOAD", "course", course_id,
+            new_value={"count": report["created"], "skipped": report["skipped"], "errors": report["errors"]}
+        )
+        await db.commit()
+    except ImportFormatError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=f"Bulk upload failed: {str(e)}")
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Bulk upload failed: {str(e)}")
+
+    if report["created"]:
+        # publish() NOTIFYs over a sync pool connection; keep it off the event loop
+        await run_in_threadpool(invalidation_bus.publish, "course", course_id)
+    return report
+
+
 @router.post("/courses/{course_id}/bulk-problems")
-def bulk_upload_problems(
+async def bulk_upload_problems(
     course_id: int,
     bulk_data: dict,
-    db: Session = Depends(database.get_db),
+    dry_run: bool = False,
+    db: AsyncSession = Depends(database.get_async_db),
     admin: User = Depends(get_current_admin)
 ):
     """
@@ -603,74 +685,46 @@ def bulk_upload_problems(
         ...
       ]
     }
+    
+    Existing step numbers are skipped. For large uploads use /courses/{course_id}/import,
+    which streams the body instead of parsing it into one dict.
     """
-    course = db.query(Course).filter(Course.id == course_id).first()
-    if not course:
-        raise HTTPException(status_code=404, detail="Course not found")
-
     steps = bulk_data.get("steps", [])
     if not steps:
         raise HTTPException(status_code=400, detail="No steps provided")
 
-    # Optional: Verify language/level match if provided
-    if "level" in bulk_data and bulk_data["level"] != course.level:
-        pass # Warning only? Or ignore? ignoring for now as ID is authority.
+    report = await _run_course_import(db, course_id, steps, admin, dry_run)
+    verb = "Would upload" if dry_run else "Successfully uploaded"
+    return {"message": f"{verb} {report['created']} problems", "count": report["created"], **report}
 
-    created_count = 0
-    
-    try:
-        for step in steps:
-            step_number = step.get("sequence")
-            if not step_number:
-                continue
-
-            # Check if step exists
-            existing = db.query(CourseProblem).filter(
-                CourseProblem.course_id == course_id,
-                CourseProblem.step_number == step_number
-            ).first()
-
-            if existing:
-                continue # Skip if exists (or could update?) - Plan said "APPEND or reject". Skipping for safety.
-
-            # Map fields
-            problem = CourseProblem(
-                course_id=course_id,
-                step_number=step_number,
-                title=step.get("title", f"Step {step_number}"),
-                description=step.get("mission_briefing", ""),
-                starter_code=step.get("starter_code", ""),
-                solution_code=step.get("expected_solution", ""),
-                validation_policy=step.get("slv", {})
-            )
-            db.add(problem)
-            db.flush() # Get ID
-
-            # Add test case if validation present
-            val = step.get("validation")
-            if val:
-                test_case = CourseProblemTestCase(
-                    problem_id=problem.id,
-                    input_data=val.get("input", ""),
-                    expected_output=val.get("expected_output", ""),
-                    is_hidden=False
-                )
-                db.add(test_case)
-            
-            created_count += 1
-        
-        db.commit()
-        
-        log_admin_action(
-            db, admin.id, "BULK_UPLOAD", "course", course_id,
-            new_value={"count": created_count}
-        )
 
-        return {"message": f"Successfully uploaded {created_count} problems", "count": created_count}
+@router.post("/courses/{course_id}/import")
+async def import_course_steps(
+    course_id: int,
+    request: Request,
+    format: Optional[str] = None,
+    dry_run: bool = False,
+    db: AsyncSession = Depends(database.get_async_db),
+    admin: User = Depends(get_current_admin)
+):
+    """
+    Streaming course import for large uploads.
+    
+    Body is either the bulk-problems JSON document ({"steps": [...]} or a bare
+    array of steps) or JSON Lines with one step object per line. The format is
+    taken from ?format=json|jsonl, or from an ndjson/jsonl Content-Type.
+    
+    Returns a per-step report (created / skipped / error). With dry_run=true
+    nothing is written and created steps are reported as "would_create".
+    """
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = "jsonl" if ("ndjson" in content_type or "jsonl" in content_type) else "json"
+    if format not in ("json", "jsonl"):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'jsonl'")
 
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Bulk upload failed: {str(e)}")
+    parse = iter_jsonl_steps if format == "jsonl" else iter_json_steps
+    return await _run_course_import(db, course_id, parse(request.stream()), admin, dry_run)
 
 
 # ============================================================================
@@ -680,11 +734,27 @@ def bulk_upload_problems(
 @router.get("/courses/{course_id}/users")
 def get_course_users(
     course_id: int,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    order: str = "asc",
+    completed: Optional[bool] = None,
+    stuck_on_step: Optional[int] = None,
+    inactive_since: Optional[datetime] = None,
     db: Session = Depends(database.get_db),
     admin: User = Depends(get_current_admin)
 ):
     """
-    Get all users enrolled in a course with their progress.
+    Get users enrolled in a course with their progress, one page at a time.
+    
+    Paging:
+    - Keyset on (current_step, user_id); pass next_cursor back as cursor
+    - order: "asc" or "desc" by (current_step, user_id)
+    - limit: page size (max 500)
+    
+    Filters:
+    - completed: only learners who finished (true) or not (false)
+    - stuck_on_step: only learners whose current step is N
+    - inactive_since: only learners with no progress since this timestamp
     
     Returns:
     - User ID, username, email
@@ -696,17 +766,49 @@ def get_course_users(
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
     
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be 'asc' or 'desc'")
+    limit = max(1, min(limit, 500))
+    
     total_problems = db.query(CourseProblem).filter(
         CourseProblem.course_id == course_id
     ).count()
     
-    progress_records = db.query(UserCourseProgress).filter(
-        UserCourseProgress.course_id == course_id
-    ).all()
+    # User is joined in the same query (no lazy load per row)
+    query = db.query(UserCourseProgress, User).join(
+        User, User.id == UserCourseProgress.user_id
+    ).filter(UserCourseProgress.course_id == course_id)
+    
+    if completed is True:
+        query = query.filter(UserCourseProgress.current_step > total_problems)
+    elif completed is False:
+        query = query.filter(UserCourseProgress.current_step <= total_problems)
+    if stuck_on_step is not None:
+        query = query.filter(UserCourseProgress.current_step == stuck_on_step)
+    if inactive_since is not None:
+        query = query.filter(UserCourseProgress.updated_at < inactive_since)
+    
+    total_users = query.order_by(None).count()
+    
+    if cursor:
+        try:
+            after_step, after_user_id = (int(part) for part in cursor.split(":"))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        key = tuple_(UserCourseProgress.current_step, UserCourseProgress.user_id)
+        query = query.filter(key > (after_step, after_user_id) if order == "asc" else key < (after_step, after_user_id))
+    
+    if order == "asc":
+        query = query.order_by(UserCourseProgress.current_step.asc(), UserCourseProgress.user_id.asc())
+    else:
+        query = query.order_by(UserCourseProgress.current_step.desc(), UserCourseProgress.user_id.desc())
+    
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
     
     result = []
-    for progress in progress_records:
-        user = progress.user
+    for progress, user in rows:
         completed_steps = max(0, progress.current_step - 1)
         percentage = round((completed_steps / total_problems * 100), 1) if total_problems > 0 else 0
         
@@ -721,11 +823,17 @@ def get_course_users(
             "last_updated": progress.updated_at.isoformat() if progress.updated_at else None
         })
     
+    next_cursor = None
+    if has_more and rows:
+        last_progress = rows[-1][0]
+        next_cursor = f"{last_progress.current_step}:{last_progress.user_id}"
+    
     return {
         "course_id": course_id,
         "language": course.language,
-        "total_users": len(result),
-        "users": result
+        "total_users": total_users,
+        "users": result,
+        "next_cursor": next_cursor
     }
 
 
@@ -757,16 +865,16 @@ def reset_user_progress(
     user = db.query(User).filter(User.id == user_id).first()
     course = db.query(Course).filter(Course.id == course_id).first()
     
-    # Delete progress record
-    db.delete(progress)
-    db.commit()
-    
-    # Audit log
+    # Audit log (same transaction)
     log_admin_action(
         db, admin.id, "RESET_PROGRESS", "user_progress", progress.id,
         old_value={"user_id": user_id, "course_id": course_id, "last_step": progress.current_step}
     )
     
+    # Delete progress record
+    db.delete(progress)
+    db.commit()
+    
     return {
         "message": f"Progress reset for user '{user.username}' in course '{course.language}'",
         "user_id": user_id,
@@ -776,6 +884,7 @@ def reset_user_progress(
 
 @router.get("/statistics")
 def get_platform_statistics(
+    fresh: bool = False,
     db: Session = Depends(database.get_db),
     admin: User = Depends(get_current_admin)
 ):
@@ -787,42 +896,23 @@ def get_platform_statistics(
     - Total problems
     - Total users with progress
     - Average completion rate
-    """
-    total_courses = db.query(Course).count()
-    active_courses = db.query(Course).filter(Course.is_active == True).count()
-    total_problems = db.query(CourseProblem).count()
-    total_users_with_progress = db.query(UserCourseProgress.user_id).distinct().count()
-    
-    # Calculate average completion rate across all courses
-    all_progress = db.query(UserCourseProgress).all()
-    if all_progress:
-        completion_rates = []
-        for progress in all_progress:
-            total_problems_in_course = db.query(CourseProblem).filter(
-                CourseProblem.course_id == progress.course_id
-            ).count()
-            if total_problems_in_course > 0:
-                completed = max(0, progress.current_step - 1)
-                rate = (completed / total_problems_in_course) * 100
-                completion_rates.append(rate)
-        
-        avg_completion = round(sum(completion_rates) / len(completion_rates), 1) if completion_rates else 0
-    else:
-        avg_completion = 0
+    - Per-course completion distribution (deciles)
     
+    Served from a periodically refreshed snapshot; fresh=true recomputes it now.
+    """
+    if fresh:
+        platform_stats.refresh(db)
+    return platform_stats.get(db)
+
+
+@router.get("/cache-stats")
+def get_catalog_cache_stats(
+    admin: User = Depends(get_current_admin)
+):
+    """Course catalog cache version and hit-rate statistics, plus invalidation bus state."""
     return {
-        "courses": {
-            "total": total_courses,
-            "active": active_courses,
-            "inactive": total_courses - active_courses
-        },
-        "problems": {
-            "total": total_problems
-        },
-        "users": {
-            "with_progress": total_users_with_progress
-        },
-        "avg_completion_rate": avg_completion
+        **catalog_cache.stats(),
+        "invalidation_bus": invalidation_bus.stats()
     }
 
 
@@ -849,14 +939,15 @@ def add_test_case(
         is_hidden=test_case_data.is_hidden
     )
     db.add(test_case)
-    db.commit()
-    db.refresh(test_case)
+    db.flush() # Get ID
     
-    # Audit log
+    # Audit log (same transaction)
     log_admin_action(
         db, admin.id, "ADD_TEST_CASE", "test_case", test_case.id,
         new_value={"problem_id": problem_id, "is_hidden": test_case.is_hidden}
     )
+    db.commit()
+    db.refresh(test_case)
     
     return test_case
 
@@ -888,12 +979,61 @@ def delete_test_case(
     
     problem_id = test_case.problem_id
     db.delete(test_case)
-    db.commit()
     
-    # Audit log
+    # Audit log (same transaction)
     log_admin_action(
         db, admin.id, "DELETE_TEST_CASE", "test_case", test_case_id,
         old_value={"problem_id": problem_id}
     )
+    db.commit()
     
     return {"message": "Test case deleted successfully"}
+
+
+# ============================================================================
+# AUDIT LOG
+# ============================================================================
+
+@router.get("/audit-logs")
+def list_audit_logs(
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    admin_id: Optional[int] = None,
+    action: Optional[str] = None,
+    entity_type: Optional[str] = None,
+    entity_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    db: Session = Depends(database.get_db),
+    admin: User = Depends(get_current_admin)
+):
+    """
+    Admin audit trail, newest first.
+    
+    Paging: pass next_cursor back as cursor (keyset on timestamp, id).
+    Filters: admin_id, action, entity_type + entity_id, since / until.
+    """
+    limit = max(1, min(limit, 200))
+    try:
+        entries, next_cursor = audit_log_page(
+            db, limit=limit, cursor=cursor, admin_id=admin_id, action=action,
+            entity_type=entity_type, entity_id=entity_id, since=since, until=until
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    return {
+        "entries": [
+            {
+                "id": entry.id,
+                "admin_id": entry.admin_id,
+                "action": entry.action,
+                "entity_type": entry.entity_type,
+                "entity_id": entry.entity_id,
+                "old_value": entry.old_value,
+                "new_value": entry.new_value,
+                "timestamp": entry.timestamp.isoformat() if entry.timestamp else None
+            } for entry in entries
+        ],
+        "next_cursor": next_cursor
+    }
@@ -7,6 +7,8 @@ from app.schemas import schemas
 
 from app.core.security import get_password_hash # Not needed here but keeping clean imports
 from app.api.deps import get_current_admin
+from app.services import test_cases
+from app.services.invalidation_bus import invalidation_bus
 
 router = APIRouter()
 
@@ -37,21 +39,14 @@ def create_problem(
             is_test_problem=problem.is_test_problem if hasattr(problem, 'is_test_problem') else False
         )
         db.add(db_problem)
-        db.commit()
-        db.refresh(db_problem)
+        db.flush() # Get ID
         
-        # Add test cases
-        for tc in problem.test_cases:
-            db_tc = models.TestCase(
-                problem_id=db_problem.id,
-                input_data=tc.input_data,
-                expected_output=tc.expected_output,
-                is_hidden=tc.is_hidden
-            )
-            db.add(db_tc)
+        # Add test cases (one multi-row insert, same transaction)
+        test_cases.insert_test_cases(db, models.TestCase, db_problem.id, problem.test_cases)
         
         db.commit()
         db.refresh(db_problem)
+        invalidation_bus.publish("problem", db_problem.id)
         
         # Ensure starter_codes is a dict (fixes ResponseValidationError if DB column is Text)
         if isinstance(db_problem.starter_codes, str):
@@ -97,25 +92,18 @@ def update_problem(
 
     try:
         update_data = problem_update.dict(exclude_unset=True)
-        test_cases = update_data.pop("test_cases", None)
+        new_test_cases = update_data.pop("test_cases", None)
 
         for key, value in update_data.items():
             setattr(db_problem, key, value)
         
-        if test_cases is not None:
-            # Simple approach: delete old test cases and add new ones
-            db.query(models.TestCase).filter(models.TestCase.problem_id == problem_id).delete()
-            for tc in test_cases:
-                db_tc = models.TestCase(
-                    problem_id=problem_id,
-                    input_data=tc.input_data,
-                    expected_output=tc.expected_output,
-                    is_hidden=tc.is_hidden
-                )
-                db.add(db_tc)
+        if new_test_cases is not None:
+            # Only rows that actually changed are written
+            test_cases.sync_test_cases(db, models.TestCase, problem_id, new_test_cases)
         
         db.commit()
         db.refresh(db_problem)
+        invalidation_bus.publish("problem", problem_id)
         return db_problem
     except Exception as e:
         db.rollback()
@@ -136,6 +124,7 @@ def delete_problem(
         db.query(models.TestCase).filter(models.TestCase.problem_id == problem_id).delete()
         db.delete(db_problem)
         db.commit()
+        invalidation_bus.publish("problem", problem_id)
         return {"status": "success", "message": "Problem deleted"}
     except Exception as e:
         db.rollback()
@@ -1,60 +1,46 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
+import base64
+from datetime import datetime, timezone
 from typing import Optional
-from sqlalchemy.orm import Session
+from sqlalchemy import select, func, case, literal, tuple_, union_all
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.db import database
 from app.models import models
 from app.models.learning import Course, CourseProblem, UserCourseProgress, SubmissionLog
 from app.schemas import schemas
 from app.api.deps import get_current_user
+from app.services import user_stats
+from app.services.behavior_buffer import behavior_buffer, coerce_id, coerce_text, parse_client_timestamp
+from app.services.proctoring_rules import proctoring_rules
+from app.services.course_catalog import courses_with_progress_query
 
 router = APIRouter()
 
 @router.get("/stats/{user_id}")
-def get_student_stats(user_id: int, db: Session = Depends(database.get_db)):
-    # Legacy submissions (Tests)
-    test_submissions = db.query(models.Submission).filter(models.Submission.user_id == user_id).all()
-    
-    # New Learning submissions
-    learning_logs = db.query(SubmissionLog).filter(SubmissionLog.user_id == user_id).all()
-    
-    total_test_attempts = len(test_submissions)
-    total_learning_attempts = len(learning_logs)
+async def get_student_stats(user_id: int, db: AsyncSession = Depends(database.get_async_db)):
+    # Attempt totals, unique solves and streak come from the rollup (tests + learning combined)
+    # CURRENT_DATE rides along so the streak is judged on the same clock record_attempt uses
+    stats, today = (await db.execute(
+        select(models.UserStats, func.current_date()).filter(models.UserStats.user_id == user_id)
+    )).first() or (None, None)
     
     # Mastered steps across all courses
-    mastery_records = db.query(UserCourseProgress).filter(UserCourseProgress.user_id == user_id).all()
-    total_steps_mastered = sum([max(0, m.current_step - 1) for m in mastery_records])
-    
-    # Total unique problems/steps passed
-    unique_solved_ids = {s.problem_id for s in test_submissions if s.verdict == "Passed"}
-    # For learning, successful attempts are in SubmissionLog with verdict "Passed"
-    unique_learning_solved = {l.problem_id for l in learning_logs if l.verdict == "Passed"}
-    
-    passed_submissions = len(unique_solved_ids) + len(unique_learning_solved)
+    total_steps_mastered = await db.scalar(
+        select(func.coalesce(func.sum(func.greatest(UserCourseProgress.current_step - 1, 0)), 0)).filter(
+            UserCourseProgress.user_id == user_id
+        )
+    )
     
-    total_submissions = total_test_attempts + total_learning_attempts
-    failed_attempts = len([s for s in test_submissions if s.verdict != "Passed"]) + \
-                      len([l for l in learning_logs if l.verdict != "Passed"])
+    total_submissions = stats.total_attempts if stats else 0
+    passed_submissions = stats.unique_solved if stats else 0
+    failed_attempts = stats.failed_attempts if stats else 0
     
     strike_rate = 0.0
     if total_submissions > 0:
         strike_rate = failed_attempts / total_submissions
     
-    # Calculate streak (combining both sources)
-    from datetime import datetime, date, timedelta
-    dates = {s.created_at.date() for s in test_submissions}
-    dates.update({l.timestamp.date() for l in learning_logs})
-    sorted_dates = sorted(list(dates), reverse=True)
-    
-    streak = 0
-    if sorted_dates:
-        today = date.today()
-        if sorted_dates[0] == today or sorted_dates[0] == today - timedelta(days=1):
-            streak = 1
-            for i in range(len(sorted_dates) - 1):
-                if sorted_dates[i] - sorted_dates[i+1] == timedelta(days=1):
-                    streak += 1
-                else:
-                    break
+    streak = user_stats.active_streak(stats, today)
                     
     return {
         "solved_count": passed_submissions,
@@ -77,67 +63,170 @@ def get_random_tip():
     ]
     return {"tip": random.choice(tips)}
 
+def _encode_history_cursor(row) -> str:
+    raw = f"{row.submitted_at.isoformat()}|{row.type}|{row.row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_history_cursor(cursor: str):
+    try:
+        submitted_at, kind, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(submitted_at), kind, int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _before_cursor(ts_column, id_column, kind: str, cursor):
+    """
+    Rows strictly after the cursor in (submitted_at, type, id) DESC order,
+    written per branch so each side can still use its (user_id, time) index.
+    """
+    cursor_ts, cursor_kind, cursor_id = cursor
+    if kind == cursor_kind:
+        return tuple_(ts_column, id_column) < (cursor_ts, cursor_id)
+    if kind > cursor_kind:
+        return ts_column < cursor_ts
+    return ts_column <= cursor_ts
+
+def submission_history_query(
+    user_id: int,
+    limit: int,
+    cursor=None,
+    test_id: Optional[int] = None,
+    verdict: Optional[str] = None,
+    problem_id: Optional[int] = None,
+    source: Optional[str] = None
+):
+    """
+    Test submissions and learning logs merged in SQL, newest first.
+    Each branch is limited before the UNION ALL so neither side reads more than a page.
+    """
+    branches = []
+    
+    if source in (None, "TEST"):
+        test_branch = select(
+            models.Submission.id.label("row_id"),
+            literal("TEST").label("type"),
+            models.Submission.problem_id.label("problem_id"),
+            models.Problem.title.label("problem_title"),
+            models.Submission.verdict.label("verdict"),
+            models.Submission.passed_cases.label("passed_cases"),
+            models.Submission.total_cases.label("total_cases"),
+            models.Submission.created_at.label("submitted_at")
+        ).join(models.Problem, models.Problem.id == models.Submission.problem_id).filter(
+            models.Submission.user_id == user_id
+        )
+        if test_id:
+            test_branch = test_branch.filter(models.Submission.test_id == test_id)
+        if verdict:
+            test_branch = test_branch.filter(models.Submission.verdict == verdict)
+        if problem_id:
+            test_branch = test_branch.filter(models.Submission.problem_id == problem_id)
+        if cursor:
+            test_branch = test_branch.filter(_before_cursor(models.Submission.created_at, models.Submission.id, "TEST", cursor))
+        branches.append(test_branch.order_by(
+            models.Submission.created_at.desc(), models.Submission.id.desc()
+        ).limit(limit))
+    
+    # Learning logs only belong to the global view (test_id is None)
+    if source in (None, "LEARNING") and not test_id:
+        learning_branch = select(
+            SubmissionLog.id.label("row_id"),
+            literal("LEARNING").label("type"),
+            SubmissionLog.problem_id.label("problem_id"),
+            CourseProblem.title.label("problem_title"),
+            SubmissionLog.verdict.label("verdict"),
+            case((SubmissionLog.verdict == "Passed", 1), else_=0).label("passed_cases"), # Step is binary
+            literal(1).label("total_cases"),
+            SubmissionLog.timestamp.label("submitted_at")
+        ).join(CourseProblem, CourseProblem.id == SubmissionLog.problem_id).filter(
+            SubmissionLog.user_id == user_id
+        )
+        if verdict:
+            learning_branch = learning_branch.filter(SubmissionLog.verdict == verdict)
+        if problem_id:
+            learning_branch = learning_branch.filter(SubmissionLog.problem_id == problem_id)
+        if cursor:
+            learning_branch = learning_branch.filter(_before_cursor(SubmissionLog.timestamp, SubmissionLog.id, "LEARNING", cursor))
+        branches.append(learning_branch.order_by(
+            SubmissionLog.timestamp.desc(), SubmissionLog.id.desc()
+        ).limit(limit))
+    
+    if not branches:
+        return None
+    
+    merged = union_all(*[branch.subquery().select() for branch in branches]).subquery()
+    return select(merged).order_by(
+        merged.c.submitted_at.desc(), merged.c.type.desc(), merged.c.row_id.desc()
+    ).limit(limit)
+
+def _history_item(row) -> dict:
+    return {
+        "id": f"{'t' if row.type == 'TEST' else 'l'}_{row.row_id}",
+        "problem_id": row.problem_id,
+        "problem_title": row.problem_title,
+        "verdict": row.verdict,
+        "passed_cases": row.passed_cases,
+        "total_cases": row.total_cases,
+        "type": row.type,
+        "submitted_at": row.submitted_at.isoformat()
+    }
+
 @router.get("/submissions/{user_id}")
 def get_student_submissions(
     user_id: int, 
     test_id: Optional[int] = None,
     db: Session = Depends(database.get_db)
 ):
-    # Fetch legacy/test submissions
-    test_query = db.query(models.Submission).filter(models.Submission.user_id == user_id)
-    if test_id:
-        test_query = test_query.filter(models.Submission.test_id == test_id)
-    test_submissions = test_query.order_by(models.Submission.created_at.desc()).all()
-    
-    # Fetch learning logs (only for global view, test_id is None)
-    learning_logs = []
-    if not test_id:
-        learning_logs = db.query(SubmissionLog).filter(SubmissionLog.user_id == user_id).order_by(SubmissionLog.timestamp.desc()).all()
-    
-    combined = []
-    for s in test_submissions:
-        combined.append({
-            "id": f"t_{s.id}",
-            "problem_id": s.problem_id,
-            "problem_title": s.problem.title,
-            "verdict": s.verdict,
-            "passed_cases": s.passed_cases,
-            "total_cases": s.total_cases,
-            "type": "TEST",
-            "submitted_at": s.created_at.isoformat()
-        })
-        
-    for l in learning_logs:
-        combined.append({
-            "id": f"l_{l.id}",
-            "problem_id": l.problem_id,
-            "problem_title": l.problem.title,
-            "verdict": l.verdict,
-            "passed_cases": 1 if l.verdict == "Passed" else 0, # Step is binary
-            "total_cases": 1,
-            "type": "LEARNING",
-            "submitted_at": l.timestamp.isoformat()
-        })
-        
-    # Sort by time
-    combined.sort(key=lambda x: x["submitted_at"], reverse=True)
+    # Latest 50 across tests and learning; use /submissions/{user_id}/page to go further back
+    query = submission_history_query(user_id, 50, test_id=test_id)
+    return [_history_item(row) for row in db.execute(query).all()]
+
+@router.get("/submissions/{user_id}/page")
+def get_student_submissions_page(
+    user_id: int,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    test_id: Optional[int] = None,
+    verdict: Optional[str] = None,
+    problem_id: Optional[int] = None,
+    source: Optional[str] = None,
+    db: Session = Depends(database.get_db)
+):
+    """
+    Cursor-paginated submission history, newest first.
+    
+    - cursor: opaque value from the previous page's next_cursor
+    - verdict: e.g. "Passed", "Failed", "Error"
+    - problem_id: filter on one problem (pair with source, since tests and courses number problems separately)
+    - source: "TEST" or "LEARNING"
+    """
+    if source is not None:
+        source = source.upper()
+        if source not in ("TEST", "LEARNING"):
+            raise HTTPException(status_code=400, detail="source must be 'TEST' or 'LEARNING'")
+    limit = max(1, min(limit, 200))
+    decoded = _decode_history_cursor(cursor) if cursor else None
+    
+    query = submission_history_query(
+        user_id, limit + 1, cursor=decoded, test_id=test_id,
+        verdict=verdict, problem_id=problem_id, source=source
+    )
+    rows = db.execute(query).all() if query is not None else []
+    has_more = len(rows) > limit
+    rows = rows[:limit]
     
-    return combined[:50] # Limit to 50 for performance
+    return {
+        "items": [_history_item(row) for row in rows],
+        "next_cursor": _encode_history_cursor(rows[-1]) if has_more and rows else None
+    }
 
 @router.get("/analytics/{user_id}")
-def get_student_analytics(user_id: int, db: Session = Depends(database.get_db)):
+async def get_student_analytics(user_id: int, db: AsyncSession = Depends(database.get_async_db)):
     # 1. Course/Language mastery breakdown
-    courses = db.query(Course).filter(Course.is_active == True).all()
+    rows = (await db.execute(courses_with_progress_query(user_id))).all()
     category_mastery = []
     
-    for course in courses:
-        total_steps = db.query(CourseProblem).filter(CourseProblem.course_id == course.id).count()
-        progress = db.query(UserCourseProgress).filter(
-            UserCourseProgress.user_id == user_id,
-            UserCourseProgress.course_id == course.id
-        ).first()
-        
-        mastered = max(0, progress.current_step - 1) if progress else 0
+    for course, current_step, total_steps in rows:
+        mastered = max(0, current_step - 1) if current_step is not None else 0
         percentage = round((mastered / total_steps * 100), 1) if total_steps > 0 else 0
         
         category_mastery.append({
@@ -148,19 +237,22 @@ def get_student_analytics(user_id: int, db: Session = Depends(database.get_db)):
         })
     
     # 2. Activity Heatmap (combining Tests and Learning)
-    from datetime import datetime, timedelta, date
-    today = date.today()
+    from datetime import timedelta
+    # Days are written on the database's clock (see user_stats.record_attempt)
+    today = await db.scalar(select(func.current_date()))
     last_30_days = [today - timedelta(days=i) for i in range(29, -1, -1)]
     
-    test_subs = db.query(models.Submission).filter(models.Submission.user_id == user_id).all()
-    learning_logs = db.query(SubmissionLog).filter(SubmissionLog.user_id == user_id).all()
-    
-    submission_dates = [s.created_at.date() for s in test_subs]
-    submission_dates.extend([l.timestamp.date() for l in learning_logs])
+    # Bounded range read: at most 30 rows
+    activity_rows = (await db.execute(select(models.UserDailyActivity.day, models.UserDailyActivity.attempts).filter(
+        models.UserDailyActivity.user_id == user_id,
+        models.UserDailyActivity.day >= last_30_days[0],
+        models.UserDailyActivity.day <= today
+    ))).all()
+    attempts_by_day = {row.day: row.attempts for row in activity_rows}
     
     heatmap = []
     for day in last_30_days:
-        count = submission_dates.count(day)
+        count = attempts_by_day.get(day, 0)
         level = 0
         if count > 8: level = 3
         elif count > 4: level = 2
@@ -172,6 +264,16 @@ def get_student_analytics(user_id: int, db: Session = Depends(database.get_db)):
             "level": level
         })
         
+    # Streak within the heatmap window, counted back from today (or yesterday if today is still idle)
+    recent_streak = 0
+    window = [h["count"] for h in reversed(heatmap)]
+    if window and window[0] == 0:
+        window = window[1:]
+    for count in window:
+        if count == 0:
+            break
+        recent_streak += 1
+    
     # 3. Milestones (updated for learning flow)
     total_mastered = sum([c["solved"] for c in category_mastery])
     
@@ -179,7 +281,7 @@ def get_student_analytics(user_id: int, db: Session = Depends(database.get_db)):
         {"icon": "\ud83c\udfc1", "name": "First Blood", "desc": "Completed 1st step", "active": total_mastered >= 1},
         {"icon": "\ud83c\udfc6", "name": "Polyglot", "desc": "Started 2+ courses", "active": len([c for c in category_mastery if c["solved"] > 0]) >= 2},
         {"icon": "\ud83d\udee1\ufe0f", "name": "Deep Dive", "desc": "Mastered 5 steps", "active": total_mastered >= 5},
-        {"icon": "\ud83d\udd25", "name": "On Fire", "desc": "Active 3+ day streak", "active": total_mastered >= 1} # Placeholder for logic above if needed
+        {"icon": "\ud83d\udd25", "name": "On Fire", "desc": "Active 3+ day streak", "active": recent_streak >= 3}
     ]
     
     return {
@@ -211,6 +313,9 @@ def get_student_test_results(user_id: int, test_id: int, db: Session = Depends(d
             (models.Submission.created_at >= st_fallback) &
             (models.Submission.created_at <= et_fallback)
         ) if problem_ids else (models.Submission.test_id == test_id)
+    ).options(
+        # Code is returned for every row: fetch the blobs in one extra query
+        selectinload(models.Submission.code_blob)
     ).order_by(models.Submission.created_at.desc()).all()
 
     # Separate true submissions from runs
@@ -222,15 +327,15 @@ def get_student_test_results(user_id: int, test_id: int, db: Session = Depends(d
         if s.problem_id not in latest_true_subs:
             latest_true_subs[s.problem_id] = s
     
-    # 4. Get Violations
-    violations_raw = db.query(models.BehaviorLog).filter(
-        models.BehaviorLog.user_id == user_id,
-        models.BehaviorLog.test_id == test_id
+    # 4. Get Violations (persisted counters plus what this worker has not flushed yet)
+    counters = db.query(models.ViolationCounter).filter(
+        models.ViolationCounter.test_id == test_id,
+        models.ViolationCounter.user_id == user_id
     ).all()
     
-    v_counts = {}
-    for v in violations_raw:
-        v_counts[v.event_type] = v_counts.get(v.event_type, 0) + 1
+    v_counts = {c.event_type: c.count for c in counters}
+    for (_, event_type), count in proctoring_rules.pending_counts(test_id, user_id).items():
+        v_counts[event_type] = v_counts.get(event_type, 0) + count
     
     # Format violations for frontend
     all_types = ["TAB_SWITCH", "OBJECT_DETECTED", "CAMERA_BLOCKED", "EXIT_FULLSCREEN"]
@@ -281,23 +386,65 @@ def get_user_enrollments(user_id: int, db: Session = Depends(database.get_db)):
         } for e in enrollments
     ]
 
+MAX_BEHAVIOR_BATCH = 500
+
+def _behavior_row(event: dict, user_id: int, received_at: datetime) -> dict:
+    # Every row carries the same keys so the buffer can write one multi-row INSERT;
+    # client values are coerced to the column types so one bad event cannot fail a flush
+    return {
+        "user_id": user_id,
+        "problem_id": coerce_id(event.get("problem_id")),
+        "test_id": coerce_id(event.get("test_id")),
+        "event_type": coerce_text(event.get("event_type")),
+        "severity": coerce_text(event.get("severity"), "LOW"),
+        "details": coerce_text(event.get("details"), ""),
+        "timestamp": parse_client_timestamp(event.get("timestamp"), received_at)
+    }
+
 @router.post("/log-behavior")
 def log_behavior_violation(
     violation: dict,
-    db: Session = Depends(database.get_db)
+    current_user: models.User = Depends(get_current_user)
 ):
-    """Log proctoring violations during tests"""
-    log = models.BehaviorLog(
-        user_id=violation.get("user_id"),
-        problem_id=violation.get("problem_id"),
-        test_id=violation.get("test_id"),
-        event_type=violation.get("event_type"),
-        severity=violation.get("severity", "LOW"),
-        details=violation.get("details", "")
-    )
-    db.add(log)
-    db.commit()
-    return {"status": "logged", "event_type": violation.get("event_type")}
+    """Log a proctoring violation for the current user (written behind; see /log-behavior/batch)"""
+    received_at = datetime.now(timezone.utc)
+    row = _behavior_row(violation, current_user.id, received_at)
+    behavior_buffer.add(row)
+    fired = proctoring_rules.observe_many([row])
+    return {"status": "logged", "event_type": violation.get("event_type"), "disqualified": bool(fired)}
+
+@router.post("/log-behavior/batch")
+def log_behavior_batch(
+    payload: dict,
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Log a batch of proctoring events for the current user.
+    
+    Body: {"events": [{"test_id", "problem_id", "event_type", "severity", "details", "timestamp"}, ...]}
+    timestamp is the client time (epoch ms or ISO-8601); implausible values are replaced by the receive time.
+    """
+    events = payload.get("events")
+    if not isinstance(events, list):
+        raise HTTPException(status_code=400, detail="events must be a list")
+    if len(events) > MAX_BEHAVIOR_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BEHAVIOR_BATCH} events per batch")
+    
+    received_at = datetime.now(timezone.utc)
+    rows = [
+        _behavior_row(event, current_user.id, received_at)
+        for event in events
+        if isinstance(event, dict) and event.get("event_type")
+    ]
+    accepted = behavior_buffer.add_many(rows)
+    fired = proctoring_rules.observe_many(rows)
+    return {
+        "status": "logged",
+        "accepted": accepted,
+        "rejected": len(events) - accepted,
+        "disqualified": bool(fired),
+        "rules_fired": fired
+    }
 
 @router.get("/active-test")
 def get_active_test(db: Session = Depends(database.get_db), current_user: models.User = Depends(get_current_user)):
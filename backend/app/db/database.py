@@ -1,8 +1,13 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import QueuePool, NullPool
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 import os
+import threading
+import time
 
 # Load environment variables from .env file using absolute path
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -22,11 +27,170 @@ SQLALCHEMY_DATABASE_URL = DATABASE_URL
 # fallback for local dev if postgres is not set up (commented out for prod-grade request)
 # SQLALCHEMY_DATABASE_URL = "sqlite:///./sql_app.db"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL
-)
+# ----------------------------------------------------------------------------
+# Connection pool configuration (all overridable from the environment)
+# ----------------------------------------------------------------------------
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds before a connection is replaced
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))  # 0 disables
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))
+# PgBouncer in transaction-pooling mode: PgBouncer owns the pooling, so we keep no
+# connections of our own and scope session settings to each transaction.
+DB_PGBOUNCER = _env_bool("DB_PGBOUNCER", False)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait and how often the pool runs dry."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self._stats_lock:
+                self.checkouts += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+
+    def recreate(self):
+        # Keep counters when SQLAlchemy rebuilds the pool (e.g. after engine.dispose()).
+        new_pool = super().recreate()
+        new_pool.checkouts, new_pool.timeouts = self.checkouts, self.timeouts
+        new_pool.total_wait, new_pool.max_wait = self.total_wait, self.max_wait
+        return new_pool
+
+
+connect_args = {"connect_timeout": DB_CONNECT_TIMEOUT}
+if DB_STATEMENT_TIMEOUT_MS and not DB_PGBOUNCER:
+    # PgBouncer rejects the "options" startup parameter, see the begin hook below instead.
+    connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+
+if DB_PGBOUNCER:
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        poolclass=NullPool,
+        connect_args=connect_args,
+    )
+else:
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        poolclass=InstrumentedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+
+# ----------------------------------------------------------------------------
+# Async engine (asyncpg) for read-heavy endpoints that run on the event loop
+# ----------------------------------------------------------------------------
+
+def _build_async_url(url: str):
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            url = "postgresql+asyncpg://" + url[len(prefix):]
+            break
+    parsed = make_url(url)
+    # asyncpg does not understand libpq's sslmode, it takes an "ssl" connect argument instead
+    sslmode = parsed.query.get("sslmode")
+    return parsed.difference_update_query(["sslmode"]), sslmode
+
+ASYNC_DATABASE_URL, _async_sslmode = _build_async_url(os.getenv("ASYNC_DATABASE_URL") or SQLALCHEMY_DATABASE_URL)
+
+async_connect_args = {"timeout": DB_CONNECT_TIMEOUT}
+if _async_sslmode:
+    async_connect_args["ssl"] = _async_sslmode
+if DB_PGBOUNCER:
+    # Prepared statements do not survive transaction pooling
+    async_connect_args.update({"statement_cache_size": 0, "prepared_statement_cache_size": 0})
+elif DB_STATEMENT_TIMEOUT_MS:
+    async_connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+
+if DB_PGBOUNCER:
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        poolclass=NullPool,
+        connect_args=async_connect_args,
+    )
+else:
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=async_connect_args,
+    )
+
+if DB_PGBOUNCER and DB_STATEMENT_TIMEOUT_MS:
+    @event.listens_for(engine, "begin")
+    @event.listens_for(async_engine.sync_engine, "begin")
+    def _set_transaction_statement_timeout(conn):
+        # SET LOCAL dies with the transaction, so it never leaks to another client's server connection
+        conn.exec_driver_sql(f"SET LOCAL statement_timeout = {DB_STATEMENT_TIMEOUT_MS}")
+
+
+def get_pool_stats() -> dict:
+    """Live connection pool statistics."""
+    pool = engine.pool
+    stats = {
+        "pool_class": type(pool).__name__,
+        "pgbouncer_mode": DB_PGBOUNCER,
+        "statement_timeout_ms": DB_STATEMENT_TIMEOUT_MS,
+    }
+    if isinstance(pool, InstrumentedQueuePool):
+        stats.update({
+            "pool_size": pool.size(),
+            "max_overflow": DB_MAX_OVERFLOW,
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(0, pool.overflow()),
+            "pool_timeout_seconds": DB_POOL_TIMEOUT,
+            "pool_recycle_seconds": DB_POOL_RECYCLE,
+            "pre_ping": DB_POOL_PRE_PING,
+            "checkouts": pool.checkouts,
+            "checkout_timeouts": pool.timeouts,
+            "avg_wait_ms": round(pool.total_wait / pool.checkouts * 1000, 3) if pool.checkouts else 0.0,
+            "max_wait_ms": round(pool.max_wait * 1000, 3),
+        })
+    async_pool = async_engine.sync_engine.pool
+    if not DB_PGBOUNCER:
+        stats["async"] = {
+            "pool_size": async_pool.size(),
+            "checked_in": async_pool.checkedin(),
+            "checked_out": async_pool.checkedout(),
+            "overflow": max(0, async_pool.overflow()),
+        }
+    return stats
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
@@ -36,3 +200,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -3,6 +3,11 @@ from fastapi.middleware.cors import CORSMiddleware
 from .db import database
 from .models import models
 from .api.v1.endpoints import problems, student, admin, execution, auth, learning, learning_admin
+from .services.invalidation_bus import invalidation_bus
+from .services.platform_stats import platform_stats
+from .services.partitions import partition_maintenance
+from .services.behavior_buffer import behavior_buffer
+from .services.proctoring_rules import proctoring_rules
 # Create tables
 models.Base.metadata.create_all(bind=database.engine)
 
@@ -38,3 +43,21 @@ app.include_router(learning_admin.router, prefix="/api/v1/admin/learning", tags=
 @app.get("/")
 def read_root():
     return {"status": "ok", "message": "CodeVault API is running"}
+
+@app.on_event("startup")
+def start_background_workers():
+    invalidation_bus.start()
+    platform_stats.start()
+    partition_maintenance.start()
+    behavior_buffer.start()
+    proctoring_rules.start()
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    invalidation_bus.stop()
+    platform_stats.stop()
+    partition_maintenance.stop()
+    # Write out buffered proctoring events before the process exits
+    behavior_buffer.drain()
+    proctoring_rules.stop()
+    await database.async_engine.dispose()
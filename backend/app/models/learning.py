@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, UniqueConstraint, JSON, Float
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, UniqueConstraint, JSON, Float, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.database import Base
@@ -91,10 +91,17 @@ class AdminAuditLog(Base):
     new_value = Column(JSON, nullable=True)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
     
+    __table_args__ = (
+        Index("ix_admin_audit_logs_timestamp_id", "timestamp", "id"),
+        Index("ix_admin_audit_logs_admin_id_timestamp", "admin_id", "timestamp"),
+        Index("ix_admin_audit_logs_entity_timestamp", "entity_type", "entity_id", "timestamp"),
+    )
+    
     # Relationships
     admin = relationship("User")
 
 
+# Monthly range partitions on timestamp in Postgres (see app.services.partitions)
 class SubmissionLog(Base):
     __tablename__ = "submission_logs"
     
@@ -107,6 +114,10 @@ class SubmissionLog(Base):
     payload_size = Column(Integer, nullable=True)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
     
+    __table_args__ = (
+        Index("ix_submission_logs_user_id_timestamp", "user_id", "timestamp"),
+    )
+    
     # Relationships
     user = relationship("User")
     problem = relationship("CourseProblem")
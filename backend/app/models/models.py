@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, Float, JSON
+import zlib
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Date, Text, Float, JSON, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.database import Base
@@ -44,14 +45,20 @@ class TestCase(Base):
     
     problem = relationship("Problem", back_populates="test_cases")
 
+# Monthly range partitions on created_at in Postgres (see app.services.partitions)
 class Submission(Base):
     __tablename__ = "submissions"
+    __table_args__ = (
+        Index("ix_submissions_user_id_created_at", "user_id", "created_at"),
+        Index("ix_submissions_test_id_user_id", "test_id", "user_id"),
+        Index("ix_submissions_problem_id_created_at", "problem_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     problem_id = Column(Integer, ForeignKey("problems.id"))
     test_id = Column(Integer, ForeignKey("scheduled_tests.id"), nullable=True)  # New: track test submissions
-    code = Column(Text)
+    code_sha256 = Column(String(64), ForeignKey("code_blobs.sha256"), nullable=True)  # Source lives in code_blobs
     verdict = Column(String) # "Passed", "Failed", "Error"
     passed_cases = Column(Integer, default=0)
     total_cases = Column(Integer, default=0)
@@ -62,15 +69,39 @@ class Submission(Base):
 
     user = relationship("User", back_populates="submissions")
     problem = relationship("Problem", back_populates="submissions")
+    code_blob = relationship("CodeBlob")
+
+    @property
+    def code(self):
+        """Source text; loads the blob on first access (use selectinload for lists)."""
+        return self.code_blob.text if self.code_blob else None
+
+# Content-addressed, zlib-compressed submission source shared by identical resubmissions
+# (written through services/code_store.py).
+class CodeBlob(Base):
+    __tablename__ = "code_blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+    size = Column(Integer, nullable=False)  # Uncompressed bytes
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    @property
+    def text(self) -> str:
+        return zlib.decompress(self.data).decode("utf-8")
 
 # Telemetry Models
+# Monthly range partitions on timestamp in Postgres (see app.services.partitions)
 class BehaviorLog(Base):
     __tablename__ = "behavior_logs"
+    __table_args__ = (
+        Index("ix_behavior_logs_test_id_user_id", "test_id", "user_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     problem_id = Column(Integer, ForeignKey("problems.id"), nullable=True)
-    submission_id = Column(Integer, ForeignKey("submissions.id"), nullable=True)
+    submission_id = Column(Integer, nullable=True)  # No FK: submissions is partitioned on (id, created_at)
     test_id = Column(Integer, ForeignKey("scheduled_tests.id"), nullable=True)
     event_type = Column(String) # "TAB_SWITCH", "OBJECT_DETECTED", "CAMERA_BLOCKED", "EXIT_FULLSCREEN"
     severity = Column(String, default="LOW") # "LOW", "MEDIUM", "HIGH"
@@ -82,6 +113,9 @@ class BehaviorLog(Base):
 # Exam/Test Scheduler
 class ScheduledTest(Base):
     __tablename__ = "scheduled_tests"
+    __table_args__ = (
+        Index("ix_scheduled_tests_active_window", "is_active", "start_time", "end_time"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String)
@@ -106,6 +140,9 @@ class TestProblem(Base):
 
 class TestEnrollment(Base):
     __tablename__ = "test_enrollments"
+    __table_args__ = (
+        Index("ix_test_enrollments_test_id_user_id_status", "test_id", "user_id", "status"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     test_id = Column(Integer, ForeignKey("scheduled_tests.id"))
@@ -114,3 +151,63 @@ class TestEnrollment(Base):
     
     test = relationship("ScheduledTest", back_populates="enrollments")
     user = relationship("User", back_populates="enrollments")
+
+# Proctoring event totals per (test, user, event type), maintained by the
+# streaming rules engine (see services/proctoring_rules.py) so result views
+# never re-count behavior_logs.
+class ViolationCounter(Base):
+    __tablename__ = "violation_counters"
+
+    test_id = Column(Integer, ForeignKey("scheduled_tests.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    event_type = Column(String, primary_key=True)
+    count = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+# Leaderboard read model: one row per non-admin user with at least one passed submission.
+# Maintained in the same transaction as the passing Submission (see services/leaderboard.py).
+class LeaderboardEntry(Base):
+    __tablename__ = "leaderboard"
+    __table_args__ = (
+        Index("ix_leaderboard_solved_user_id", "solved", "user_id"),
+    )
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    solved = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    user = relationship("User")
+
+# Per-user statistics rollup for the student dashboard, covering both test
+# submissions and learning submission logs (see services/user_stats.py).
+class UserStats(Base):
+    __tablename__ = "user_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    total_attempts = Column(Integer, default=0, nullable=False)
+    passed_attempts = Column(Integer, default=0, nullable=False)
+    failed_attempts = Column(Integer, default=0, nullable=False)
+    unique_solved = Column(Integer, default=0, nullable=False)  # distinct test problems + distinct learning steps passed
+    last_active_date = Column(Date, nullable=True)
+    current_streak = Column(Integer, default=0, nullable=False)  # consecutive active days ending at last_active_date
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+# One row per (user, source, problem) the user has passed, where source is
+# "TEST" (problems) or "LEARNING" (course steps). Inserting the row is what
+# decides a first solve, so concurrent passes cannot both count.
+class UserSolvedProblem(Base):
+    __tablename__ = "user_solved_problems"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    source = Column(String(10), primary_key=True)
+    problem_id = Column(Integer, primary_key=True)
+    solved_at = Column(DateTime(timezone=True), server_default=func.now())
+
+# One row per user per active day; powers streaks and the 30-day heatmap.
+class UserDailyActivity(Base):
+    __tablename__ = "user_daily_activity"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    passes = Column(Integer, default=0, nullable=False)
@@ -1,3 +1,6 @@
+import base64
+from datetime import datetime
+from sqlalchemy import select, tuple_
 from sqlalchemy.orm import Session
 from app.models.learning import AdminAuditLog
 from typing import Any, Optional
@@ -13,6 +16,8 @@ def log_admin_action(
 ):
     """
     Log an admin action to the audit logs table.
+    Does not commit: call it before the commit of the change being audited,
+    so the change and its audit entry are written in one transaction.
     """
     log_entry = AdminAuditLog(
         admin_id=admin_id,
@@ -23,6 +28,50 @@ def log_admin_action(
         new_value=new_value
     )
     db.add(log_entry)
-    db.commit()
-    db.refresh(log_entry)
     return log_entry
+
+def encode_audit_cursor(entry: AdminAuditLog) -> str:
+    raw = f"{entry.timestamp.isoformat()}|{entry.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_audit_cursor(cursor: str):
+    """Returns (timestamp, id); raises ValueError on a malformed cursor."""
+    timestamp, entry_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    return datetime.fromisoformat(timestamp), int(entry_id)
+
+def audit_log_page(
+    db: Session,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    admin_id: Optional[int] = None,
+    action: Optional[str] = None,
+    entity_type: Optional[str] = None,
+    entity_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+):
+    """
+    Newest-first page of audit entries, keyset-paginated on (timestamp, id).
+    Returns (entries, next_cursor).
+    """
+    query = select(AdminAuditLog)
+    if admin_id is not None:
+        query = query.filter(AdminAuditLog.admin_id == admin_id)
+    if action:
+        query = query.filter(AdminAuditLog.action == action)
+    if entity_type:
+        query = query.filter(AdminAuditLog.entity_type == entity_type)
+    if entity_id is not None:
+        query = query.filter(AdminAuditLog.entity_id == entity_id)
+    if since:
+        query = query.filter(AdminAuditLog.timestamp >= since)
+    if until:
+        query = query.filter(AdminAuditLog.timestamp < until)
+    if cursor:
+        query = query.filter(tuple_(AdminAuditLog.timestamp, AdminAuditLog.id) < decode_audit_cursor(cursor))
+
+    entries = db.execute(
+        query.order_by(AdminAuditLog.timestamp.desc(), AdminAuditLog.id.desc()).limit(limit + 1)
+    ).scalars().all()
+    next_cursor = encode_audit_cursor(entries[limit - 1]) if len(entries) > limit else None
+    return entries[:limit], next_cursor
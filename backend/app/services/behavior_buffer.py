@@ -0,0 +1,263 @@
+"""
+Write-behind buffer for proctoring events.
+
+The proctoring endpoints hand events to this buffer instead of committing a
+BehaviorLog row per request. A daemon thread writes the buffer with one
+multi-row INSERT when it reaches FLUSH_SIZE events or FLUSH_INTERVAL_SECONDS
+after the last flush, whichever comes first. Shutdown drains whatever is left.
+
+Events are acknowledged before they are durable: a crash loses at most one
+flush interval of events. If the buffer grows past MAX_BUFFERED (e.g. the
+database is unreachable) the request that overflows it tries an inline flush,
+and if that fails too the oldest events are dropped and counted.
+
+A row the database rejects (an unknown test_id, say) must not block everyone
+else's events: when a batch fails on bad data it is retried chunk by chunk and
+then row by row, and rows that still fail are dead-lettered.
+"""
+
+import json
+import os
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError
+
+from app.db import database
+from app.models.models import BehaviorLog
+
+FLUSH_SIZE = int(os.getenv("BEHAVIOR_FLUSH_SIZE", "500"))
+FLUSH_INTERVAL_SECONDS = float(os.getenv("BEHAVIOR_FLUSH_INTERVAL_SECONDS", "1.0"))
+MAX_BUFFERED = int(os.getenv("BEHAVIOR_MAX_BUFFERED", "20000"))
+DEAD_LETTER_SIZE = 100
+
+# Errors caused by the rows themselves rather than by the database being unavailable
+BAD_ROW_ERRORS = (DataError, IntegrityError)
+
+# Client timestamps outside this window are replaced by the receive time
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+MAX_EVENT_AGE = timedelta(hours=1)
+
+
+def parse_client_timestamp(value, received_at: datetime) -> datetime:
+    """
+    Accepts epoch milliseconds or an ISO-8601 string. Anything missing,
+    unparseable or implausible falls back to the server receive time.
+    """
+    ts = None
+    try:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            ts = datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+        elif isinstance(value, str) and value:
+            ts = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            if ts.tzinfo is None:
+                ts = ts.replace(tzinfo=timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        ts = None
+
+    if ts is None or ts > received_at + MAX_CLOCK_SKEW or ts < received_at - MAX_EVENT_AGE:
+        return received_at
+    return ts
+
+
+def coerce_id(value) -> Optional[int]:
+    """An integer id from client input, or None if it is not one."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return None
+
+
+def coerce_text(value, default: Optional[str] = None) -> Optional[str]:
+    """Client strings as-is; anything else serialized so it fits a text column."""
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value
+    try:
+        return json.dumps(value, default=str)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+class BehaviorEventBuffer:
+    def __init__(self):
+        self._events: List[dict] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.accepted = 0
+        self.written = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.dead_lettered = 0
+        self.dead_letters = deque(maxlen=DEAD_LETTER_SIZE)
+        self.last_flush_at: Optional[datetime] = None
+
+    def add_many(self, events: List[dict]) -> int:
+        """Queue BehaviorLog rows (dicts of column values). Returns how many were queued."""
+        if not events:
+            return 0
+        with self._lock:
+            self._events.extend(events)
+            self.accepted += len(events)
+            buffered = len(self._events)
+
+        if buffered >= MAX_BUFFERED:
+            try:
+                self.flush()
+            except Exception as e:
+                # The events are back in the buffer (oldest dropped past MAX_BUFFERED)
+                print(f"WARNING: inline behavior log flush failed: {e}")
+        elif buffered >= FLUSH_SIZE:
+            self._wake.set()
+        return len(events)
+
+    def add(self, event: dict) -> int:
+        return self.add_many([event])
+
+    def flush(self) -> int:
+        """Write everything buffered so far. Returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._events = self._events, []
+            if not batch:
+                return 0
+
+            db = database.SessionLocal()
+            try:
+                try:
+                    for start in range(0, len(batch), FLUSH_SIZE):
+                        db.execute(insert(BehaviorLog).values(batch[start:start + FLUSH_SIZE]))
+                    db.commit()
+                    written = len(batch)
+                except BAD_ROW_ERRORS:
+                    db.rollback()
+                    written = self._write_isolated(db, batch)
+                except Exception:
+                    db.rollback()
+                    self._requeue(batch)
+                    raise
+            except Exception:
+                self.failed_flushes += 1
+                raise
+            finally:
+                db.close()
+
+            self.flushes += 1
+            self.written += written
+            self.last_flush_at = datetime.now(timezone.utc)
+            return written
+
+    def _write_isolated(self, db, batch: List[dict]) -> int:
+        """
+        Retry a batch that contains bad rows: chunk by chunk, then row by row
+        inside failing chunks, dead-lettering rows that fail on their own.
+        Anything not yet written goes back to the buffer if the database
+        itself fails.
+        """
+        written = 0
+        chunk_size = max(1, FLUSH_SIZE // 10)
+        position = 0
+        try:
+            while position < len(batch):
+                chunk = batch[position:position + chunk_size]
+                try:
+                    db.execute(insert(BehaviorLog).values(chunk))
+                    db.commit()
+                    written += len(chunk)
+                    position += len(chunk)
+                    continue
+                except BAD_ROW_ERRORS:
+                    db.rollback()
+
+                for row in chunk:
+                    try:
+                        db.execute(insert(BehaviorLog).values([row]))
+                        db.commit()
+                        written += 1
+                    except BAD_ROW_ERRORS as e:
+                        db.rollback()
+                        self._dead_letter(row, e)
+                    position += 1
+        except Exception:
+            db.rollback()
+            self._requeue(batch[position:])
+            raise
+        return written
+
+    def _dead_letter(self, row: dict, error: Exception) -> None:
+        self.dead_lettered += 1
+        self.dead_letters.append({
+            "row": {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in row.items()},
+            "error": str(getattr(error, "orig", error)).strip()
+        })
+        print(f"WARNING: dropping behavior log row rejected by the database: {getattr(error, 'orig', error)}")
+
+    def _requeue(self, rows: List[dict]) -> None:
+        # Put the rows back in front of anything that arrived meanwhile, dropping the oldest past MAX_BUFFERED
+        with self._lock:
+            self._events[:0] = rows
+            overflow = len(self._events) - MAX_BUFFERED
+            if overflow > 0:
+                del self._events[:overflow]
+                self.dropped += overflow
+        if overflow > 0:
+            print(f"WARNING: behavior log buffer full, dropped {overflow} oldest events")
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(FLUSH_INTERVAL_SECONDS)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"WARNING: behavior log flush failed, will retry: {e}")
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="behavior-log-writer", daemon=True)
+        self._thread.start()
+
+    def drain(self):
+        """Stop the writer thread and flush what is left."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=FLUSH_INTERVAL_SECONDS + 5)
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"WARNING: behavior log drain failed, {len(self._events)} events lost: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            buffered = len(self._events)
+        return {
+            "buffered": buffered,
+            "accepted": self.accepted,
+            "written": self.written,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "dropped": self.dropped,
+            "dead_lettered": self.dead_lettered,
+            "recent_dead_letters": list(self.dead_letters)[-10:],
+            "last_flush_at": self.last_flush_at.isoformat() if self.last_flush_at else None,
+            "flush_size": FLUSH_SIZE,
+            "flush_interval_seconds": FLUSH_INTERVAL_SECONDS
+        }
+
+
+# Singleton instance
+behavior_buffer = BehaviorEventBuffer()
@@ -0,0 +1,41 @@
+"""
+Content-addressed storage for submission source code.
+
+Each distinct source text is stored once in code_blobs, keyed by the SHA-256
+of its UTF-8 bytes and zlib-compressed. Submissions point at the blob through
+code_sha256, so resubmitting the same solution adds no code bytes.
+"""
+
+import hashlib
+import zlib
+from typing import Optional
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.models.models import CodeBlob
+
+COMPRESSION_LEVEL = 6
+
+
+def digest(code: str) -> str:
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+
+def put(db: Session, code: Optional[str]) -> Optional[str]:
+    """
+    Store the source if it is new and return its key for Submission.code_sha256.
+    Does not commit: call it in the transaction that adds the Submission.
+    """
+    if code is None:
+        return None
+
+    sha256 = digest(code)
+    raw = code.encode("utf-8")
+    stmt = insert(CodeBlob).values(
+        sha256=sha256,
+        data=zlib.compress(raw, COMPRESSION_LEVEL),
+        size=len(raw)
+    ).on_conflict_do_nothing(index_elements=[CodeBlob.sha256])
+    db.execute(stmt)
+    return sha256
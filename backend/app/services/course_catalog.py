@@ -0,0 +1,171 @@
+"""
+Course catalog queries and cache shared by the learner endpoints.
+"""
+
+import threading
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import select, func, and_
+from sqlalchemy.orm import Session
+
+from app.models.learning import Course, CourseProblem, UserCourseProgress
+from app.services.invalidation_bus import invalidation_bus
+
+
+def courses_with_progress_query(user_id: int, active_only: bool = True):
+    """
+    One round trip for every course with its step count and the user's progress.
+
+    Row columns: Course, current_step (None if not started), total_steps.
+    """
+    step_counts = select(
+        CourseProblem.course_id,
+        func.count(CourseProblem.id).label("total_steps")
+    ).group_by(CourseProblem.course_id).subquery("step_counts")
+
+    query = select(
+        Course,
+        UserCourseProgress.current_step,
+        func.coalesce(step_counts.c.total_steps, 0).label("total_steps")
+    ).outerjoin(
+        UserCourseProgress,
+        and_(UserCourseProgress.course_id == Course.id, UserCourseProgress.user_id == user_id)
+    ).outerjoin(
+        step_counts, step_counts.c.course_id == Course.id
+    ).order_by(Course.id)
+
+    if active_only:
+        query = query.filter(Course.is_active == True)
+    return query
+
+
+class CourseCatalogCache:
+    """
+    Versioned in-process cache of the course catalog: course rows and their
+    ordered steps (title, description, starter code).
+
+    The catalog only changes through learning_admin, which publishes a
+    "course" bump on the invalidation bus after every mutation; the bus calls
+    invalidate() here and in every other worker. A load that overlaps an invalidation is served but
+    not stored, so a stale read can never outlive the write that replaced it.
+    Solution code, validation policies and test cases are never cached here.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = 0
+        # course_id -> {"course": {...}, "steps": [{...}, ...]}
+        self._courses: Dict[int, dict] = {}
+        # problem_id -> course_id
+        self._problem_index: Dict[int, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_course(self, db: Session, course_id: int) -> Optional[dict]:
+        """Course entry with its ordered steps, or None if the course does not exist."""
+        with self._lock:
+            entry = self._courses.get(course_id)
+            if entry is not None:
+                self.hits += 1
+                return entry
+            self.misses += 1
+        return self._load(db, course_id)
+
+    def get_step(self, db: Session, problem_id: int) -> Optional[Tuple[dict, dict]]:
+        """(course entry, step) for a course problem, or None if it does not exist."""
+        with self._lock:
+            course_id = self._problem_index.get(problem_id)
+            entry = self._courses.get(course_id) if course_id is not None else None
+            if entry is not None:
+                self.hits += 1
+                return entry, self._find_step(entry, problem_id)
+            self.misses += 1
+
+        if course_id is None:
+            row = db.query(CourseProblem.course_id).filter(CourseProblem.id == problem_id).first()
+            if not row:
+                return None
+            course_id = row[0]
+
+        entry = self._load(db, course_id)
+        step = self._find_step(entry, problem_id) if entry else None
+        if step is None:
+            return None
+        return entry, step
+
+    def invalidate(self, course_id: Optional[int] = None) -> None:
+        """Drop one course (or everything) and bump the catalog version."""
+        with self._lock:
+            self.version += 1
+            self.invalidations += 1
+            if course_id is None:
+                self._courses.clear()
+                self._problem_index.clear()
+                return
+            entry = self._courses.pop(course_id, None)
+            if entry:
+                for step in entry["steps"]:
+                    self._problem_index.pop(step["id"], None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "version": self.version,
+                "cached_courses": len(self._courses),
+                "cached_steps": len(self._problem_index),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations
+            }
+
+    @staticmethod
+    def _find_step(entry: dict, problem_id: int) -> Optional[dict]:
+        for step in entry["steps"]:
+            if step["id"] == problem_id:
+                return step
+        return None
+
+    def _load(self, db: Session, course_id: int) -> Optional[dict]:
+        with self._lock:
+            version = self.version
+
+        course = db.query(Course).filter(Course.id == course_id).first()
+        if not course:
+            return None
+        problems = db.query(
+            CourseProblem.id,
+            CourseProblem.course_id,
+            CourseProblem.step_number,
+            CourseProblem.title,
+            CourseProblem.description,
+            CourseProblem.starter_code,
+            CourseProblem.created_at
+        ).filter(CourseProblem.course_id == course_id).order_by(CourseProblem.step_number).all()
+
+        entry = {
+            "course": {
+                "id": course.id,
+                "language": course.language,
+                "level": course.level,
+                "level_order": course.level_order,
+                "editor_language": course.editor_language,
+                "is_active": course.is_active,
+                "created_at": course.created_at
+            },
+            "steps": [dict(p._mapping) for p in problems]
+        }
+
+        with self._lock:
+            if self.version == version:
+                self._courses[course_id] = entry
+                for step in entry["steps"]:
+                    self._problem_index[step["id"]] = course_id
+        return entry
+
+
+# Singleton instance, kept coherent across workers by the invalidation bus
+catalog_cache = CourseCatalogCache()
+invalidation_bus.register("course", catalog_cache.invalidate)
@@ -0,0 +1,305 @@
+"""
+Streaming bulk import of course steps.
+
+Uploads are parsed incrementally from the request body, either as a JSON
+document ({"steps": [...]} or a bare [...]) or as JSON Lines (one step object
+per line), so a course with hundreds of steps and large validation payloads
+never has to sit in memory as one dict.
+
+Existing step numbers are read with a single query when the import starts.
+New steps and their validation test cases are inserted in batches of
+BATCH_SIZE with multi-row INSERTs, all in the caller's transaction. Every
+step gets a report entry, and in dry-run mode nothing is written.
+"""
+
+import codecs
+import json
+import re
+from typing import AsyncIterator, List, Optional
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.learning import CourseProblem, CourseProblemTestCase
+
+BATCH_SIZE = 100
+
+_STEPS_KEY = re.compile(r'"steps"\s*:\s*\[')
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+async def _text_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    async for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+async def iter_jsonl_steps(chunks: AsyncIterator[bytes]) -> AsyncIterator[dict]:
+    """One step object per non-empty line."""
+    buffer = ""
+    line_number = 0
+    async for text in _text_chunks(chunks):
+        buffer += text
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield _parse_line(line, line_number)
+    if buffer.strip():
+        yield _parse_line(buffer, line_number + 1)
+
+
+def _parse_line(line: str, line_number: int) -> dict:
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        raise ImportFormatError(f"Invalid JSON on line {line_number}: {e}")
+
+
+class _ElementScanner:
+    """
+    Finds where one JSON value ends, fed a chunk at a time. Only structure is
+    tracked (nesting depth, strings, escapes), so every character is looked
+    at once and the value is decoded once, when it is complete.
+    """
+
+    _STRING_SPECIAL = re.compile(r'["\\]')
+    _STRUCTURAL = re.compile(r'["{}\[\],\s]')
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+
+    def feed(self, text: str, start: int = 0) -> Optional[int]:
+        """Index in `text` just past the end of the value, or None if it continues."""
+        i = start
+        n = len(text)
+        while i < n:
+            if self.escape:
+                self.escape = False
+                i += 1
+                continue
+            if self.in_string:
+                match = self._STRING_SPECIAL.search(text, i)
+                if not match:
+                    return None
+                i = match.start()
+                if text[i] == "\\":
+                    self.escape = True
+                else:
+                    self.in_string = False
+                    if self.depth == 0:
+                        return i + 1
+                i += 1
+                continue
+
+            match = self._STRUCTURAL.search(text, i)
+            if not match:
+                return None
+            i = match.start()
+            c = text[i]
+            if c == '"':
+                self.in_string = True
+            elif c in "{[":
+                self.depth += 1
+            elif c in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    return i + 1
+                if self.depth < 0:
+                    # A bare value closed by the end of the steps array
+                    return i
+            elif self.depth == 0:
+                # A bare value ends at the next separator
+                return i
+            i += 1
+        return None
+
+
+async def iter_json_steps(chunks: AsyncIterator[bytes]) -> AsyncIterator[dict]:
+    """
+    Elements of the top-level "steps" array (or of a top-level array),
+    decoded one at a time as the bytes arrive.
+    """
+    texts = _text_chunks(chunks)
+    head = ""
+    position = None
+
+    # Find the opening bracket of the steps array
+    while position is None:
+        stripped = head.lstrip()
+        if stripped.startswith("["):
+            position = len(head) - len(stripped) + 1
+        elif stripped.startswith("{"):
+            match = _STEPS_KEY.search(head)
+            if match:
+                position = match.end()
+        elif stripped:
+            raise ImportFormatError("Expected a JSON object with a \"steps\" array, or a JSON array")
+        if position is None:
+            try:
+                head += await texts.__anext__()
+            except StopAsyncIteration:
+                raise ImportFormatError("No \"steps\" array found in upload")
+
+    text = head[position:]
+    scanner = None
+    parts: List[str] = []
+    while True:
+        i = 0
+        while i < len(text):
+            if scanner is None:
+                # Skip separators up to the next element or the closing bracket
+                while i < len(text) and text[i] in " \t\r\n,":
+                    i += 1
+                if i == len(text):
+                    break
+                if text[i] == "]":
+                    return
+                scanner = _ElementScanner()
+                parts = []
+            end = scanner.feed(text, i)
+            if end is None:
+                parts.append(text[i:])
+                break
+            parts.append(text[i:end])
+            yield _parse_step("".join(parts))
+            scanner = None
+            i = end
+
+        try:
+            text = await texts.__anext__()
+        except StopAsyncIteration:
+            break
+
+    raise ImportFormatError("Unexpected end of upload inside \"steps\"")
+
+
+def _parse_step(text: str):
+    try:
+        return json.loads(text)
+    except ValueError as e:
+        raise ImportFormatError(f"Invalid step JSON: {e}")
+
+
+class CourseImporter:
+    """
+    Collects steps for one course and writes them in batches.
+
+    Report statuses per step: "created" (or "would_create" on a dry run),
+    "skipped" (step number already exists in the course or earlier in the
+    upload) and "error" (the step could not be read).
+    """
+
+    def __init__(self, db: AsyncSession, course_id: int, dry_run: bool = False, batch_size: int = BATCH_SIZE):
+        self.db = db
+        self.course_id = course_id
+        self.dry_run = dry_run
+        self.batch_size = batch_size
+        self.report: List[dict] = []
+        self._existing: Optional[set] = None
+        self._pending: List[tuple] = []  # (report entry, problem row, validation)
+
+    async def _load_existing(self):
+        # Every step number of the course in one query
+        result = await self.db.execute(
+            select(CourseProblem.step_number).filter(CourseProblem.course_id == self.course_id)
+        )
+        self._existing = set(result.scalars().all())
+
+    async def add(self, step) -> None:
+        if self._existing is None:
+            await self._load_existing()
+
+        index = len(self.report)
+        if not isinstance(step, dict):
+            self.report.append({"index": index, "step_number": None, "status": "error", "reason": "Step must be a JSON object"})
+            return
+
+        step_number = step.get("sequence")
+        entry = {"index": index, "step_number": step_number, "title": step.get("title")}
+        self.report.append(entry)
+
+        if not isinstance(step_number, int) or isinstance(step_number, bool) or step_number < 1:
+            entry.update(status="error", reason="Missing or invalid \"sequence\"")
+            return
+        if step_number in self._existing:
+            entry.update(status="skipped", reason="Step already exists")
+            return
+        validation = step.get("validation")
+        if validation is not None and not isinstance(validation, dict):
+            entry.update(status="error", reason="\"validation\" must be an object")
+            return
+
+        self._existing.add(step_number)
+        entry["title"] = step.get("title", f"Step {step_number}")
+        entry["has_test_case"] = bool(validation)
+        self._pending.append((entry, {
+            "course_id": self.course_id,
+            "step_number": step_number,
+            "title": entry["title"],
+            "description": step.get("mission_briefing", ""),
+            "starter_code": step.get("starter_code", ""),
+            "solution_code": step.get("expected_solution", ""),
+            "validation_policy": step.get("slv", {})
+        }, validation))
+
+        if len(self._pending) >= self.batch_size:
+            await self._flush()
+
+    async def _flush(self) -> None:
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+
+        if self.dry_run:
+            for entry, _, _ in pending:
+                entry["status"] = "would_create"
+            return
+
+        inserted = await self.db.execute(
+            insert(CourseProblem).values([row for _, row, _ in pending])
+            .returning(CourseProblem.id, CourseProblem.step_number)
+        )
+        ids = {step_number: problem_id for problem_id, step_number in inserted.all()}
+
+        case_rows = []
+        for entry, row, validation in pending:
+            entry.update(status="created", problem_id=ids[row["step_number"]])
+            if validation:
+                case_rows.append({
+                    "problem_id": entry["problem_id"],
+                    "input_data": validation.get("input", ""),
+                    "expected_output": validation.get("expected_output", ""),
+                    "is_hidden": False
+                })
+        if case_rows:
+            await self.db.execute(insert(CourseProblemTestCase).values(case_rows))
+
+    async def finish(self) -> dict:
+        if self._existing is None:
+            await self._load_existing()
+        await self._flush()
+
+        counts = {"created": 0, "skipped": 0, "error": 0}
+        for entry in self.report:
+            status = "created" if entry["status"] == "would_create" else entry["status"]
+            counts[status] += 1
+
+        return {
+            "course_id": self.course_id,
+            "dry_run": self.dry_run,
+            "created": counts["created"],
+            "skipped": counts["skipped"],
+            "errors": counts["error"],
+            "steps": self.report
+        }
@@ -0,0 +1,193 @@
+"""
+Cross-worker cache invalidation over Postgres LISTEN/NOTIFY.
+
+Admin writes call publish(entity, entity_id). The bus evicts locally right
+away and sends a NOTIFY, and every other uvicorn worker's listener thread
+runs the handlers registered for that entity. Caches register with
+register(entity, handler), where handler(entity_id) gets None for a full flush.
+
+Delivery is best effort, so anything that may have lost messages falls back
+to flushing everything: a listener reconnect, or a gap in a publisher's
+sequence numbers.
+
+LISTEN needs a session-level connection, so behind PgBouncer in transaction
+mode point CACHE_BUS_DATABASE_URL at Postgres directly.
+"""
+
+import json
+import os
+import select
+import threading
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+import psycopg2
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+from app.db import database
+
+CHANNEL = "cache_invalidation"
+POLL_SECONDS = 5
+MAX_BACKOFF_SECONDS = 30
+
+
+class InvalidationBus:
+    def __init__(self):
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._handlers: Dict[str, List[Callable[[Optional[int]], None]]] = {}
+        self._versions: Dict[Tuple[str, Optional[int]], int] = {}
+        self._last_seq: Dict[str, int] = {}
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.connected = False
+        self.received = 0
+        self.published = 0
+        self.full_flushes = 0
+        self.reconnects = 0
+
+    # ------------------------------------------------------------------
+    # Registration / local eviction
+    # ------------------------------------------------------------------
+
+    def register(self, entity: str, handler: Callable[[Optional[int]], None]) -> None:
+        self._handlers.setdefault(entity, []).append(handler)
+
+    def version(self, entity: str, entity_id: Optional[int] = None) -> int:
+        """Local version counter for an entity, bumped on every eviction."""
+        return self._versions.get((entity, entity_id), 0)
+
+    def _evict(self, entity: str, entity_id: Optional[int]) -> None:
+        with self._lock:
+            key = (entity, entity_id)
+            self._versions[key] = self._versions.get(key, 0) + 1
+        for handler in self._handlers.get(entity, []):
+            handler(entity_id)
+
+    def flush_all(self) -> None:
+        self.full_flushes += 1
+        for entity in list(self._handlers):
+            self._evict(entity, None)
+
+    # ------------------------------------------------------------------
+    # Publishing
+    # ------------------------------------------------------------------
+
+    def publish(self, entity: str, entity_id: Optional[int] = None) -> None:
+        """
+        Evict locally and tell the other workers. Call after the write has committed.
+        A failed NOTIFY never fails the admin request: the local cache is already
+        correct and other workers are covered by their reconnect flush.
+        """
+        self._evict(entity, entity_id)
+
+        with self._lock:
+            self._seq += 1
+            payload = json.dumps({
+                "origin": self.worker_id,
+                "seq": self._seq,
+                "entity": entity,
+                "id": entity_id
+            })
+        try:
+            with database.engine.connect() as conn:
+                conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL, "payload": payload})
+                conn.commit()
+            self.published += 1
+        except Exception as e:
+            print(f"WARNING: cache invalidation NOTIFY failed for {entity}:{entity_id}: {e}")
+
+    # ------------------------------------------------------------------
+    # Listening
+    # ------------------------------------------------------------------
+
+    def _handle(self, raw: str) -> None:
+        try:
+            message = json.loads(raw)
+        except ValueError:
+            return
+        origin = message.get("origin")
+        if origin == self.worker_id:
+            return
+
+        self.received += 1
+        seq = message.get("seq", 0)
+        last = self._last_seq.get(origin)
+        self._last_seq[origin] = seq
+        if last is not None and seq != last + 1:
+            # Missed at least one message from this publisher
+            self.flush_all()
+            return
+
+        self._evict(message.get("entity"), message.get("id"))
+
+    def _listen_dsn(self) -> str:
+        url = make_url(os.getenv("CACHE_BUS_DATABASE_URL") or database.SQLALCHEMY_DATABASE_URL)
+        return url.set(drivername="postgresql").render_as_string(hide_password=False)
+
+    def _run(self) -> None:
+        backoff = 1
+        first_connect = True
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(self._listen_dsn())
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {CHANNEL}")
+                self.connected = True
+                backoff = 1
+                if not first_connect:
+                    # Anything published while we were away is lost
+                    self.reconnects += 1
+                    self.flush_all()
+                first_connect = False
+
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], POLL_SECONDS) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._handle(conn.notifies.pop(0).payload)
+            except Exception as e:
+                if not self._stop.is_set():
+                    print(f"WARNING: cache invalidation listener disconnected: {e}")
+            finally:
+                self.connected = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            first_connect = False
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF_SECONDS)
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="cache-invalidation-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=POLL_SECONDS + 1)
+
+    def stats(self) -> dict:
+        return {
+            "worker_id": self.worker_id,
+            "connected": self.connected,
+            "published": self.published,
+            "received": self.received,
+            "full_flushes": self.full_flushes,
+            "reconnects": self.reconnects,
+            "entities": sorted(self._handlers.keys())
+        }
+
+
+# Singleton instance
+invalidation_bus = InvalidationBus()
@@ -0,0 +1,117 @@
+"""
+Leaderboard read model.
+
+The leaderboard table holds one row per non-admin user with their count of
+passed submissions. It is bumped in the same transaction that records a
+passing Submission, so serving a page or a rank never scans submissions.
+"""
+
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from typing import List, Optional
+
+from app.models.models import LeaderboardEntry, User
+
+
+def record_pass(db: Session, user: User) -> None:
+    """
+    Count one more passed submission for the user.
+    Does not commit: call it before the commit that persists the Submission.
+    """
+    if (user.role or "STUDENT").upper() == "ADMIN":
+        return
+
+    stmt = insert(LeaderboardEntry).values(user_id=user.id, solved=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[LeaderboardEntry.user_id],
+        set_={"solved": LeaderboardEntry.solved + 1, "updated_at": func.now()}
+    )
+    db.execute(stmt)
+
+
+def get_page(db: Session, skip: int = 0, limit: int = 100) -> List[dict]:
+    """Ranked leaderboard page, ordered by solved count (ties broken by user id)."""
+    rows = db.query(LeaderboardEntry, User).join(User, User.id == LeaderboardEntry.user_id).order_by(
+        LeaderboardEntry.solved.desc(),
+        LeaderboardEntry.user_id
+    ).offset(skip).limit(limit).all()
+
+    result = []
+    rank, previous = 0, None
+    for position, (entry, user) in enumerate(rows, start=skip + 1):
+        if previous is None:
+            rank = _rank_for(db, entry.solved)
+        elif entry.solved != previous:
+            # Rows are globally ordered, so a new count starts at its own position
+            rank = position
+        previous = entry.solved
+
+        result.append({
+            "id": user.id,
+            "username": user.username,
+            "email": user.email,
+            "solved": entry.solved,
+            "role": user.role,
+            "rank": rank
+        })
+    return result
+
+
+def _rank_for(db: Session, solved: int) -> int:
+    # Competition ranking: users with the same count share a rank.
+    # Range count on ix_leaderboard_solved_user_id, no table scan.
+    higher = db.query(func.count(LeaderboardEntry.user_id)).filter(LeaderboardEntry.solved > solved).scalar()
+    return higher + 1
+
+
+def get_user_rank(db: Session, user_id: int) -> Optional[dict]:
+    """Rank lookup for a single user. Users without a passed submission rank after everyone on the board."""
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        return None
+
+    entry = db.query(LeaderboardEntry).filter(LeaderboardEntry.user_id == user_id).first()
+    solved = entry.solved if entry else 0
+    if entry:
+        rank = _rank_for(db, solved)
+    else:
+        rank = db.query(func.count(LeaderboardEntry.user_id)).filter(LeaderboardEntry.solved > 0).scalar() + 1
+
+    return {
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "solved": solved,
+        "role": user.role,
+        "rank": rank
+    }
+
+
+def rebuild_leaderboard(db: Session) -> int:
+    """
+    Recompute the whole table from submissions in one transaction.
+    Returns the number of ranked users.
+    """
+    db.execute(text("DELETE FROM leaderboard"))
+    db.execute(text("""
+        INSERT INTO leaderboard (user_id, solved, updated_at)
+        SELECT s.user_id, COUNT(*), now()
+        FROM submissions s
+        JOIN users u ON u.id = s.user_id
+        WHERE s.verdict = 'Passed' AND UPPER(COALESCE(u.role, 'STUDENT')) != 'ADMIN'
+        GROUP BY s.user_id
+    """))
+    db.commit()
+    return db.query(func.count(LeaderboardEntry.user_id)).scalar()
+
+
+if __name__ == "__main__":
+    # python -m app.services.leaderboard
+    from app.db.database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        print(f"Leaderboard rebuilt: {rebuild_leaderboard(session)} users ranked")
+    finally:
+        session.close()
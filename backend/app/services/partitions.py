@@ -0,0 +1,205 @@
+"""
+Monthly partition maintenance for submissions, submission_logs and behavior_logs.
+
+The tables are turned into monthly range partitions by migration b8c9d0e1f2a3.
+This module keeps PARTITION_MONTHS_AHEAD months of empty partitions ready so
+inserts never fall into the default partition. It also applies retention:
+partitions older than PARTITION_RETENTION_MONTHS are detached and then moved
+to the archive schema (or left detached in place). Retention 0 keeps everything.
+
+Each table is maintained in its own transaction, so a failure on one table
+does not hold back partition creation or retention on the others. Rows that
+landed in a default partition while maintenance was not running are moved
+into their month's partition when it is created (see migration f2a3b4c5d6e7).
+
+Tables that were never partitioned (e.g. created by create_all on a fresh
+database) are skipped.
+
+Run once by hand with:
+    python -m app.services.partitions
+"""
+
+import os
+import re
+import threading
+from datetime import date, datetime, timezone
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.db import database
+
+# table -> partition column
+PARTITIONED_TABLES = {
+    "submissions": "created_at",
+    "submission_logs": "timestamp",
+    "behavior_logs": "timestamp",
+}
+
+MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+RETENTION_MONTHS = int(os.getenv("PARTITION_RETENTION_MONTHS", "0"))
+RETENTION_ACTION = os.getenv("PARTITION_RETENTION_ACTION", "archive")  # "archive" or "detach"
+ARCHIVE_SCHEMA = os.getenv("PARTITION_ARCHIVE_SCHEMA", "archive")
+MAINTENANCE_INTERVAL_SECONDS = int(os.getenv("PARTITION_MAINTENANCE_INTERVAL_SECONDS", "21600"))
+
+# Only one worker runs maintenance at a time
+ADVISORY_LOCK_KEY = 741_002
+
+
+def _add_months(day: date, months: int) -> date:
+    month_index = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def is_partitioned(db: Session, table: str) -> bool:
+    return db.execute(
+        text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:t))"),
+        {"t": table}
+    ).scalar()
+
+
+def list_partitions(db: Session, table: str) -> list:
+    """Monthly partitions still attached to `table`, as (name, month) oldest first."""
+    names = db.execute(text("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(:t)"""), {"t": table}).scalars().all()
+
+    pattern = re.compile(rf"^{table}_p(\d{{4}})_(\d{{2}})$")
+    partitions = []
+    for name in names:
+        match = pattern.match(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+def ensure_future_partitions(db: Session, table: str, months_ahead: int = MONTHS_AHEAD) -> int:
+    """Create any missing partitions of `table` from this month through `months_ahead` months out."""
+    this_month = date.today().replace(day=1)
+    return db.execute(
+        text("SELECT ensure_monthly_partitions(:t, :start, :end)"),
+        {"t": table, "start": this_month, "end": _add_months(this_month, months_ahead)}
+    ).scalar()
+
+
+def detach_expired_partitions(
+    db: Session,
+    table: str,
+    retention_months: int = RETENTION_MONTHS,
+    action: str = RETENTION_ACTION
+) -> list:
+    """
+    Detach partitions of `table` whose whole month is older than `retention_months`.
+    action="archive" also moves them into ARCHIVE_SCHEMA so they drop out of
+    the default search_path; action="detach" leaves them as standalone tables.
+    """
+    if retention_months <= 0:
+        return []
+    if action not in ("archive", "detach"):
+        raise ValueError(f"Unknown partition retention action: {action}")
+
+    cutoff = _add_months(date.today().replace(day=1), -retention_months)
+    if action == "archive":
+        db.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{ARCHIVE_SCHEMA}"'))
+
+    detached = []
+    for name, month in list_partitions(db, table):
+        if month >= cutoff:
+            break
+        db.execute(text(f'ALTER TABLE {table} DETACH PARTITION "{name}"'))
+        if action == "archive":
+            db.execute(text(f'ALTER TABLE "{name}" SET SCHEMA "{ARCHIVE_SCHEMA}"'))
+        detached.append(name)
+    return detached
+
+
+def run_maintenance(db: Session) -> dict:
+    """
+    Create upcoming partitions and apply retention, one transaction per table.
+    A table that fails is reported under "errors" and retried on the next run.
+    """
+    report = {"created": {}, "detached": {}, "errors": {}}
+    for table in PARTITIONED_TABLES:
+        try:
+            locked = db.execute(text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": ADVISORY_LOCK_KEY}).scalar()
+            if not locked:
+                db.rollback()
+                report["skipped"] = "another worker holds the maintenance lock"
+                break
+            if not is_partitioned(db, table):
+                db.rollback()
+                continue
+
+            created = ensure_future_partitions(db, table)
+            detached = detach_expired_partitions(db, table)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            report["errors"][table] = str(e)
+            print(f"WARNING: partition maintenance failed for {table}: {e}")
+            continue
+
+        report["created"][table] = created
+        if detached:
+            report["detached"][table] = detached
+    return report
+
+
+class PartitionMaintenance:
+    """Runs run_maintenance every MAINTENANCE_INTERVAL_SECONDS on a daemon thread."""
+
+    def __init__(self, interval_seconds: int = MAINTENANCE_INTERVAL_SECONDS):
+        self.interval_seconds = interval_seconds
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_report: Optional[dict] = None
+        self.last_run_at: Optional[datetime] = None
+
+    def run_once(self) -> dict:
+        db = database.SessionLocal()
+        try:
+            report = run_maintenance(db)
+        finally:
+            db.close()
+        self.last_report = report
+        self.last_run_at = datetime.now(timezone.utc)
+        return report
+
+    def _run(self):
+        # First pass at startup so a long-stopped deployment catches up right away
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"WARNING: partition maintenance failed: {e}")
+            self._stop.wait(self.interval_seconds)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="partition-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> dict:
+        return {
+            "months_ahead": MONTHS_AHEAD,
+            "retention_months": RETENTION_MONTHS,
+            "retention_action": RETENTION_ACTION,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "last_report": self.last_report
+        }
+
+
+# Singleton instance
+partition_maintenance = PartitionMaintenance()
+
+
+if __name__ == "__main__":
+    print(partition_maintenance.run_once())
@@ -0,0 +1,169 @@
+"""
+Platform statistics for the learning admin.
+
+Everything is computed with grouped SQL aggregates (no per-row queries).
+A snapshot is kept in process and refreshed on a schedule by a background
+thread, so the admin page normally reads memory instead of scanning
+user_course_progress.
+"""
+
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.db import database
+
+REFRESH_SECONDS = int(os.getenv("PLATFORM_STATS_REFRESH_SECONDS", "300"))
+
+DECILES = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9]
+
+OVERVIEW_SQL = text("""
+    SELECT
+        (SELECT COUNT(*) FROM courses) AS total_courses,
+        (SELECT COUNT(*) FROM courses WHERE is_active = true) AS active_courses,
+        (SELECT COUNT(*) FROM course_problems) AS total_problems,
+        (SELECT COUNT(DISTINCT user_id) FROM user_course_progress) AS users_with_progress
+""")
+
+# Completion rate per progress row = completed steps / course steps * 100,
+# NULL for courses without steps so they drop out of every aggregate.
+COURSE_BREAKDOWN_SQL = text("""
+    WITH step_counts AS (
+        SELECT course_id, COUNT(*) AS total_steps
+        FROM course_problems
+        GROUP BY course_id
+    ),
+    rates AS (
+        SELECT
+            p.course_id,
+            p.current_step,
+            sc.total_steps,
+            CASE WHEN sc.total_steps > 0
+                 THEN GREATEST(p.current_step - 1, 0) * 100.0 / sc.total_steps
+            END AS rate
+        FROM user_course_progress p
+        LEFT JOIN step_counts sc ON sc.course_id = p.course_id
+    )
+    SELECT
+        c.id AS course_id,
+        c.language,
+        c.level,
+        c.is_active,
+        COALESCE(sc.total_steps, 0) AS total_steps,
+        COUNT(r.course_id) AS learners,
+        COUNT(r.rate) AS rated_learners,
+        COUNT(r.course_id) FILTER (WHERE r.current_step > r.total_steps) AS completed_learners,
+        AVG(r.rate) AS avg_completion,
+        percentile_cont(CAST(:deciles AS double precision[])) WITHIN GROUP (ORDER BY r.rate) AS deciles
+    FROM courses c
+    LEFT JOIN step_counts sc ON sc.course_id = c.id
+    LEFT JOIN rates r ON r.course_id = c.id
+    GROUP BY c.id, c.language, c.level, c.is_active, sc.total_steps
+    ORDER BY c.id
+""")
+
+
+def compute_platform_statistics(db: Session) -> dict:
+    """Two aggregate queries regardless of the number of progress rows."""
+    overview = db.execute(OVERVIEW_SQL).one()
+    rows = db.execute(COURSE_BREAKDOWN_SQL, {"deciles": DECILES}).all()
+
+    courses = []
+    weighted_sum = 0.0
+    rated_total = 0
+    for row in rows:
+        avg = float(row.avg_completion) if row.avg_completion is not None else None
+        if avg is not None:
+            weighted_sum += avg * row.rated_learners
+            rated_total += row.rated_learners
+
+        deciles = row.deciles if row.rated_learners else None
+        courses.append({
+            "course_id": row.course_id,
+            "language": row.language,
+            "level": row.level,
+            "is_active": row.is_active,
+            "total_steps": row.total_steps,
+            "learners": row.learners,
+            "completed_learners": row.completed_learners,
+            "avg_completion_rate": round(avg, 1) if avg is not None else 0,
+            "completion_deciles": {
+                f"p{int(q * 100)}": round(float(v), 1) for q, v in zip(DECILES, deciles)
+            } if deciles else None
+        })
+
+    return {
+        "courses": {
+            "total": overview.total_courses,
+            "active": overview.active_courses,
+            "inactive": overview.total_courses - overview.active_courses
+        },
+        "problems": {
+            "total": overview.total_problems
+        },
+        "users": {
+            "with_progress": overview.users_with_progress
+        },
+        "avg_completion_rate": round(weighted_sum / rated_total, 1) if rated_total else 0,
+        "course_breakdown": courses
+    }
+
+
+class PlatformStatsSnapshot:
+    """Latest computed statistics, refreshed every REFRESH_SECONDS by a daemon thread."""
+
+    def __init__(self, refresh_seconds: int = REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._data: Optional[dict] = None
+        self._taken_at: Optional[datetime] = None
+
+    def refresh(self, db: Optional[Session] = None) -> dict:
+        own_session = db is None
+        db = db or database.SessionLocal()
+        try:
+            data = compute_platform_statistics(db)
+        finally:
+            if own_session:
+                db.close()
+        with self._lock:
+            self._data = data
+            self._taken_at = datetime.now(timezone.utc)
+        return data
+
+    def get(self, db: Session) -> dict:
+        """Latest snapshot, computed on the spot if none exists yet."""
+        with self._lock:
+            data, taken_at = self._data, self._taken_at
+        if data is None:
+            data = self.refresh(db)
+            with self._lock:
+                taken_at = self._taken_at
+        return {**data, "snapshot_at": taken_at.isoformat(), "source": "snapshot"}
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_seconds):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"WARNING: platform statistics refresh failed: {e}")
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="platform-stats-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+# Singleton instance
+platform_stats = PlatformStatsSnapshot()
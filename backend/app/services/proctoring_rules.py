@@ -0,0 +1,397 @@
+"""
+Streaming proctoring rules engine.
+
+Every proctoring event passes through observe_many() as it is ingested. For
+each (test, user, event_type) the engine keeps the timestamps of the last N
+events, where N is the rule threshold. A rule such as "5 TAB_SWITCH within
+120 seconds" fires when that deque is full and spans no more than the window,
+so each event costs O(1). When a rule fires the enrollment is set to
+DISQUALIFIED immediately.
+
+Per-key totals are also accumulated in memory and added to the
+violation_counters table every PERSIST_INTERVAL_SECONDS, so result views read
+counters instead of counting behavior_logs.
+
+Rules come from PROCTORING_RULES as a JSON list of
+{"event_type": ..., "threshold": ..., "window_seconds": ...}; DEFAULT_RULES
+apply when it is unset. Windows are tracked per worker, so a student whose
+events are spread across workers may need slightly more events to trip a rule.
+Persisted totals are always exact.
+
+Rules only fire on events inside the test's start/end window, and only move
+an enrollment that is still in progress (REGISTERED or PRESENT) to
+DISQUALIFIED, so events sent while a finished test is being closed (e.g. the
+fullscreen exit after complete-test) cannot disqualify it.
+
+Each persist also re-reads the enrollments this worker has disqualified, so a
+student an admin reinstates is evaluated again, and forgets disqualifications
+older than DISQUALIFIED_TTL.
+"""
+
+import json
+import os
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+
+from app.db import database
+from app.models.models import ScheduledTest, TestEnrollment, ViolationCounter
+from app.services.behavior_buffer import BAD_ROW_ERRORS, coerce_id
+
+DEFAULT_RULES = [
+    {"event_type": "TAB_SWITCH", "threshold": 5, "window_seconds": 120},
+    {"event_type": "EXIT_FULLSCREEN", "threshold": 3, "window_seconds": 300},
+    {"event_type": "OBJECT_DETECTED", "threshold": 2, "window_seconds": 600},
+    {"event_type": "MULTIPLE_PERSONS", "threshold": 2, "window_seconds": 600},
+    {"event_type": "KICKED_OUT", "threshold": 1, "window_seconds": 1},
+]
+
+PERSIST_INTERVAL_SECONDS = float(os.getenv("PROCTORING_PERSIST_INTERVAL_SECONDS", "10"))
+DISQUALIFIED_TTL = timedelta(hours=12)
+TEST_WINDOW_CACHE_SECONDS = 60
+
+# Enrollment statuses a rule may still move to DISQUALIFIED
+DISQUALIFIABLE_STATUSES = ("REGISTERED", "PRESENT")
+
+Key = Tuple[int, int, str]  # (test_id, user_id, event_type)
+
+
+def load_rules() -> Dict[str, dict]:
+    raw = os.getenv("PROCTORING_RULES")
+    rules = DEFAULT_RULES
+    if raw:
+        try:
+            rules = json.loads(raw)
+        except ValueError as e:
+            print(f"WARNING: invalid PROCTORING_RULES, using defaults: {e}")
+    return {
+        rule["event_type"]: {
+            "event_type": rule["event_type"],
+            "threshold": max(1, int(rule["threshold"])),
+            "window": timedelta(seconds=float(rule["window_seconds"]))
+        }
+        for rule in rules
+    }
+
+
+def _aware(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+class ProctoringRulesEngine:
+    def __init__(self, rules: Optional[Dict[str, dict]] = None):
+        self.rules = rules if rules is not None else load_rules()
+        self._windows: Dict[Key, deque] = {}
+        self._pending: Dict[Key, int] = {}
+        self._disqualified: Dict[Tuple[int, int], datetime] = {}
+        self._test_windows: Dict[int, tuple] = {}  # test_id -> (start, end, fetched_at)
+        self._lock = threading.Lock()
+        self._persist_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.events_seen = 0
+        self.rules_fired = 0
+        self.events_outside_window = 0
+        self.persist_failures = 0
+        self.dropped_keys = 0
+        self.last_persist_at: Optional[datetime] = None
+
+    # ------------------------------------------------------------------
+    # Ingestion
+    # ------------------------------------------------------------------
+
+    def observe_many(self, events: List[dict]) -> List[dict]:
+        """
+        Feed BehaviorLog rows (user_id, test_id, event_type, timestamp).
+        Returns the rule firings that led to a new disqualification.
+        """
+        try:
+            windows = self._test_windows_for({coerce_id(event.get("test_id")) for event in events} - {None})
+        except Exception as e:
+            # Without the schedule no rule can be checked; counts are still kept
+            print(f"WARNING: could not load test windows for proctoring rules: {e}")
+            windows = {}
+
+        fired = []
+        with self._lock:
+            for event in sorted(events, key=lambda e: e["timestamp"]):
+                test_id, user_id, event_type = coerce_id(event.get("test_id")), coerce_id(event.get("user_id")), event.get("event_type")
+                if test_id is None or user_id is None or not isinstance(event_type, str) or not event_type:
+                    continue
+                self.events_seen += 1
+                key = (test_id, user_id, event_type)
+                self._pending[key] = self._pending.get(key, 0) + 1
+
+                rule = self.rules.get(event_type)
+                if rule is None or (test_id, user_id) in self._disqualified:
+                    continue
+                test_window = windows.get(test_id)
+                if test_window is None or not test_window[0] <= event["timestamp"] <= test_window[1]:
+                    self.events_outside_window += 1
+                    continue
+                window = self._windows.get(key)
+                if window is None:
+                    window = self._windows[key] = deque(maxlen=rule["threshold"])
+                window.append(event["timestamp"])
+                if len(window) == rule["threshold"] and window[-1] - window[0] <= rule["window"]:
+                    self._disqualified[(test_id, user_id)] = datetime.now(timezone.utc)
+                    self.rules_fired += 1
+                    fired.append({
+                        "test_id": test_id,
+                        "user_id": user_id,
+                        "event_type": event_type,
+                        "threshold": rule["threshold"],
+                        "window_seconds": rule["window"].total_seconds()
+                    })
+
+        disqualified = []
+        for firing in fired:
+            try:
+                if self._disqualify(firing["test_id"], firing["user_id"]):
+                    disqualified.append(firing)
+                    continue
+                # Not enrolled or already finished: nothing to disqualify, let later events re-evaluate
+            except Exception as e:
+                print(f"WARNING: proctoring disqualification failed for {firing}: {e}")
+            # Let the next event for this student try again
+            with self._lock:
+                self._disqualified.pop((firing["test_id"], firing["user_id"]), None)
+        return disqualified
+
+    def _test_windows_for(self, test_ids: set) -> Dict[int, tuple]:
+        """(start, end) per test, cached for TEST_WINDOW_CACHE_SECONDS; unknown tests are left out."""
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            cached = {
+                test_id: self._test_windows[test_id]
+                for test_id in test_ids
+                if test_id in self._test_windows
+                and (now - self._test_windows[test_id][2]).total_seconds() < TEST_WINDOW_CACHE_SECONDS
+            }
+        missing = test_ids - cached.keys()
+        if missing:
+            db = database.SessionLocal()
+            try:
+                rows = db.execute(
+                    select(ScheduledTest.id, ScheduledTest.start_time, ScheduledTest.end_time)
+                    .filter(ScheduledTest.id.in_(missing))
+                ).all()
+            finally:
+                db.close()
+            with self._lock:
+                for test_id, start, end in rows:
+                    if start is None or end is None:
+                        continue
+                    entry = (_aware(start), _aware(end), now)
+                    self._test_windows[test_id] = cached[test_id] = entry
+                # Drop stale entries so the cache stays bounded by recently active tests
+                for test_id in [t for t, entry in self._test_windows.items()
+                                if (now - entry[2]).total_seconds() >= TEST_WINDOW_CACHE_SECONDS * 10]:
+                    del self._test_windows[test_id]
+        return {test_id: entry[:2] for test_id, entry in cached.items()}
+
+    def _disqualify(self, test_id: int, user_id: int) -> bool:
+        """
+        Disqualify an enrollment that is still in progress. Returns False if the
+        user is not enrolled or the enrollment is already COMPLETED (or otherwise final).
+        """
+        db = database.SessionLocal()
+        try:
+            result = db.execute(
+                update(TestEnrollment)
+                .where(
+                    TestEnrollment.test_id == test_id,
+                    TestEnrollment.user_id == user_id,
+                    TestEnrollment.status.in_(DISQUALIFIABLE_STATUSES)
+                )
+                .values(status="DISQUALIFIED")
+            )
+            db.commit()
+            return result.rowcount > 0
+        finally:
+            db.close()
+
+    def is_disqualified(self, test_id: int, user_id: int) -> bool:
+        with self._lock:
+            return (test_id, user_id) in self._disqualified
+
+    def pending_counts(self, test_id: int, user_id: Optional[int] = None) -> Dict[Tuple[int, str], int]:
+        """Counts seen by this worker but not yet persisted, keyed by (user_id, event_type)."""
+        with self._lock:
+            return {
+                (key[1], key[2]): count
+                for key, count in self._pending.items()
+                if key[0] == test_id and (user_id is None or key[1] == user_id)
+            }
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def persist(self) -> int:
+        """Add pending counts to violation_counters. Returns the number of keys written."""
+        with self._persist_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._prune()
+            written = 0
+            if pending:
+                try:
+                    written = self._write_counters(pending)
+                except Exception:
+                    self.persist_failures += 1
+                    raise
+            self.last_persist_at = datetime.now(timezone.utc)
+
+        try:
+            self._refresh_disqualified()
+        except Exception as e:
+            print(f"WARNING: could not refresh disqualified enrollments: {e}")
+        return written
+
+    def _write_counters(self, pending: Dict[Key, int]) -> int:
+        """
+        Upsert all pending keys at once. If a key is invalid (e.g. an unknown
+        test) the keys are written one by one and the bad ones dropped; if the
+        database itself fails, whatever is unwritten goes back to _pending.
+        """
+        rows = [
+            {"test_id": test_id, "user_id": user_id, "event_type": event_type, "count": count}
+            for (test_id, user_id, event_type), count in pending.items()
+        ]
+        db = database.SessionLocal()
+        try:
+            try:
+                db.execute(self._upsert(rows))
+                db.commit()
+                return len(rows)
+            except BAD_ROW_ERRORS:
+                db.rollback()
+            except Exception:
+                db.rollback()
+                self._requeue(rows)
+                raise
+
+            written = 0
+            for index, row in enumerate(rows):
+                try:
+                    db.execute(self._upsert([row]))
+                    db.commit()
+                    written += 1
+                except BAD_ROW_ERRORS as e:
+                    db.rollback()
+                    self.dropped_keys += 1
+                    print(f"WARNING: dropping violation counter {row}: {getattr(e, 'orig', e)}")
+                except Exception:
+                    db.rollback()
+                    self._requeue(rows[index:])
+                    raise
+            return written
+        finally:
+            db.close()
+
+    def _requeue(self, rows: List[dict]) -> None:
+        with self._lock:
+            for row in rows:
+                key = (row["test_id"], row["user_id"], row["event_type"])
+                self._pending[key] = self._pending.get(key, 0) + row["count"]
+
+    @staticmethod
+    def _upsert(rows: List[dict]):
+        stmt = insert(ViolationCounter).values(rows)
+        return stmt.on_conflict_do_update(
+            index_elements=[ViolationCounter.test_id, ViolationCounter.user_id, ViolationCounter.event_type],
+            set_={"count": ViolationCounter.count + stmt.excluded.count, "updated_at": func.now()}
+        )
+
+    def _prune(self) -> None:
+        """Drop windows that can no longer fire (caller holds _lock)."""
+        now = datetime.now(timezone.utc)
+        stale = [
+            key for key, window in self._windows.items()
+            if not window or now - window[-1] > self.rules[key[2]]["window"]
+        ]
+        for key in stale:
+            del self._windows[key]
+
+    def _refresh_disqualified(self) -> None:
+        """
+        Forget disqualifications that no longer hold: enrollments an admin has
+        changed back, and entries older than DISQUALIFIED_TTL. Their windows
+        are cleared so the student starts from zero.
+        """
+        cutoff = datetime.now(timezone.utc) - DISQUALIFIED_TTL
+        with self._lock:
+            keys = {key for key, at in self._disqualified.items() if at >= cutoff}
+        still = set()
+        if keys:
+            db = database.SessionLocal()
+            try:
+                still = set(db.execute(
+                    select(TestEnrollment.test_id, TestEnrollment.user_id).filter(
+                        tuple_(TestEnrollment.test_id, TestEnrollment.user_id).in_(list(keys)),
+                        TestEnrollment.status == "DISQUALIFIED"
+                    )
+                ).tuples().all())
+            finally:
+                db.close()
+
+        with self._lock:
+            for key, at in list(self._disqualified.items()):
+                # Keep entries added while we were reading
+                if key in still or (at >= cutoff and key not in keys):
+                    continue
+                del self._disqualified[key]
+                for window_key in [k for k in self._windows if k[:2] == key]:
+                    del self._windows[window_key]
+
+    def _run(self):
+        while not self._stop.wait(PERSIST_INTERVAL_SECONDS):
+            try:
+                self.persist()
+            except Exception as e:
+                print(f"WARNING: violation counter persist failed, will retry: {e}")
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="proctoring-counters", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the persist thread and write out what is pending."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=PERSIST_INTERVAL_SECONDS + 5)
+        try:
+            self.persist()
+        except Exception as e:
+            print(f"WARNING: violation counter persist failed on shutdown: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            windows, pending, disqualified = len(self._windows), len(self._pending), len(self._disqualified)
+        return {
+            "rules": [
+                {"event_type": r["event_type"], "threshold": r["threshold"], "window_seconds": r["window"].total_seconds()}
+                for r in self.rules.values()
+            ],
+            "events_seen": self.events_seen,
+            "rules_fired": self.rules_fired,
+            "events_outside_window": self.events_outside_window,
+            "active_windows": windows,
+            "pending_keys": pending,
+            "persist_failures": self.persist_failures,
+            "dropped_keys": self.dropped_keys,
+            "disqualified": disqualified,
+            "last_persist_at": self.last_persist_at.isoformat() if self.last_persist_at else None
+        }
+
+
+# Singleton instance
+proctoring_rules = ProctoringRulesEngine()
@@ -1,4 +1,7 @@
 import time
+import threading
+from collections import deque
+from contextlib import contextmanager
 from typing import Dict, Tuple
 from fastapi import HTTPException
 
@@ -6,21 +9,118 @@ class RateLimiter:
     """
     A simple in-memory rate limiter for code submissions.
     Supports tiered limits for correct vs failed attempts.
+
+    Limits adapt to judge load: the judge reports how many runs are
+    executing and how long they take, and the effective window/cooldown
+    loosen when the judge is idle and tighten when concurrent runs or the
+    p95 latency build up. Judge runs execute inline in request threads, so
+    concurrent runs (not a queue) are the load signal. The p95 only covers
+    runs that finished in the last LATENCY_WINDOW_SECONDS, so a slow burst
+    stops tightening limits once it is over, even if no new runs arrive.
     """
     def __init__(self):
         # user_id -> [timestamps]
         self.submissions: Dict[int, list] = {}
         # user_id -> failure_count
         self.failure_penalties: Dict[int, int] = {}
-        
+
         self.WINDOW_SECONDS = 60
         self.MAX_SUBMISSIONS_PER_WINDOW = 5
         self.FAILURE_THRESHOLD = 3
         self.PENALTY_COOLDOWN_SECONDS = 300 # 5 minutes
 
+        # Adaptive bounds
+        self.MIN_SUBMISSIONS_PER_WINDOW = 2
+        self.RELAXED_SUBMISSIONS_PER_WINDOW = 10
+        self.MIN_PENALTY_COOLDOWN_SECONDS = 60
+        self.MAX_PENALTY_COOLDOWN_SECONDS = 900
+        self.JUDGE_CONCURRENCY_CAPACITY = 8 # concurrent runs at which the judge counts as saturated
+        self.TARGET_P95_SECONDS = 2.0
+        self.LATENCY_WINDOW_SECONDS = 120 # p95 only looks at runs that finished this recently
+        self.RELAXED_LOAD = 0.5 # below this load factor limits are loosened
+
+        # Judge telemetry
+        self.in_flight = 0
+        self.latencies = deque(maxlen=200) # (finished_at, elapsed)
+        self.decisions = deque(maxlen=100)
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Judge load tracking
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def track_judge(self):
+        """Wrap a judge run so concurrency and latency feed the limits."""
+        with self._lock:
+            self.in_flight += 1
+        started = time.time()
+        try:
+            yield
+        finally:
+            finished = time.time()
+            with self._lock:
+                self.in_flight -= 1
+                self.latencies.append((finished, finished - started))
+
+    def _recent_latencies(self) -> list:
+        """Latencies of runs that finished within LATENCY_WINDOW_SECONDS; older samples are dropped."""
+        cutoff = time.time() - self.LATENCY_WINDOW_SECONDS
+        with self._lock:
+            while self.latencies and self.latencies[0][0] < cutoff:
+                self.latencies.popleft()
+            return [elapsed for _, elapsed in self.latencies]
+
+    def p95_latency(self) -> float:
+        samples = sorted(self._recent_latencies())
+        if not samples:
+            return 0.0
+        index = min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))
+        return samples[index]
+
+    def load_factor(self) -> float:
+        """1.0 means the judge is at capacity; above 1.0 it is overloaded."""
+        concurrency_load = self.in_flight / self.JUDGE_CONCURRENCY_CAPACITY
+        latency_load = self.p95_latency() / self.TARGET_P95_SECONDS
+        return max(concurrency_load, latency_load)
+
+    def effective_limits(self) -> Tuple[int, int, str]:
+        """Returns (max_submissions_per_window, penalty_cooldown_seconds, load_state)."""
+        load = self.load_factor()
+
+        if load < self.RELAXED_LOAD:
+            return (
+                self.RELAXED_SUBMISSIONS_PER_WINDOW,
+                max(self.MIN_PENALTY_COOLDOWN_SECONDS, self.PENALTY_COOLDOWN_SECONDS // 2),
+                "RELAXED"
+            )
+
+        if load <= 1.0:
+            return self.MAX_SUBMISSIONS_PER_WINDOW, self.PENALTY_COOLDOWN_SECONDS, "NORMAL"
+
+        max_submissions = max(self.MIN_SUBMISSIONS_PER_WINDOW, int(self.MAX_SUBMISSIONS_PER_WINDOW / load))
+        cooldown = min(self.MAX_PENALTY_COOLDOWN_SECONDS, int(self.PENALTY_COOLDOWN_SECONDS * load))
+        return max_submissions, cooldown, "TIGHT"
+
+    def _record_decision(self, user_id: int, allowed: bool, reason: str, max_submissions: int, cooldown: int, load_state: str):
+        self.decisions.append({
+            "timestamp": time.time(),
+            "user_id": user_id,
+            "allowed": allowed,
+            "reason": reason,
+            "max_submissions_per_window": max_submissions,
+            "penalty_cooldown_seconds": cooldown,
+            "load_state": load_state
+        })
+
+    # ------------------------------------------------------------------
+    # Submission checks
+    # ------------------------------------------------------------------
+
     def check_rate_limit(self, user_id: int):
         now = time.time()
-        
+        max_submissions, cooldown, load_state = self.effective_limits()
+
         # Clean up old timestamps
         if user_id in self.submissions:
             self.submissions[user_id] = [t for t in self.submissions[user_id] if now - t < self.WINDOW_SECONDS]
@@ -28,7 +128,8 @@ class RateLimiter:
             self.submissions[user_id] = []
 
         # Check standard limit
-        if len(self.submissions[user_id]) >= self.MAX_SUBMISSIONS_PER_WINDOW:
+        if len(self.submissions[user_id]) >= max_submissions:
+            self._record_decision(user_id, False, "WINDOW_LIMIT", max_submissions, cooldown, load_state)
             raise HTTPException(
                 status_code=429,
                 detail=f"Too many submissions. Please wait {self.WINDOW_SECONDS} seconds between batches."
@@ -39,8 +140,9 @@ class RateLimiter:
             # Check if last submission was more than penalty time ago
             if self.submissions[user_id]:
                 last_sub = self.submissions[user_id][-1]
-                if now - last_sub < self.PENALTY_COOLDOWN_SECONDS:
-                    wait_time = int(self.PENALTY_COOLDOWN_SECONDS - (now - last_sub))
+                if now - last_sub < cooldown:
+                    wait_time = int(cooldown - (now - last_sub))
+                    self._record_decision(user_id, False, "FAILURE_COOLDOWN", max_submissions, cooldown, load_state)
                     raise HTTPException(
                         status_code=429,
                         detail=f"Repeated failures detected. Cooldown active for {wait_time} more seconds."
@@ -51,6 +153,7 @@ class RateLimiter:
 
         # Log this attempt
         self.submissions[user_id].append(now)
+        self._record_decision(user_id, True, "OK", max_submissions, cooldown, load_state)
 
     def log_result(self, user_id: int, success: bool):
         if success:
@@ -59,5 +162,32 @@ class RateLimiter:
         else:
             self.failure_penalties[user_id] = self.failure_penalties.get(user_id, 0) + 1
 
+    def get_status(self) -> dict:
+        """Snapshot of judge load, effective limits and recent decisions."""
+        max_submissions, cooldown, load_state = self.effective_limits()
+        return {
+            "load_state": load_state,
+            "load_factor": round(self.load_factor(), 3),
+            "judge": {
+                "running": self.in_flight,
+                "concurrency_capacity": self.JUDGE_CONCURRENCY_CAPACITY,
+                "p95_latency_seconds": round(self.p95_latency(), 3),
+                "target_p95_seconds": self.TARGET_P95_SECONDS,
+                "latency_window_seconds": self.LATENCY_WINDOW_SECONDS,
+                "samples": len(self._recent_latencies())
+            },
+            "effective_limits": {
+                "window_seconds": self.WINDOW_SECONDS,
+                "max_submissions_per_window": max_submissions,
+                "failure_threshold": self.FAILURE_THRESHOLD,
+                "penalty_cooldown_seconds": cooldown
+            },
+            "base_limits": {
+                "max_submissions_per_window": self.MAX_SUBMISSIONS_PER_WINDOW,
+                "penalty_cooldown_seconds": self.PENALTY_COOLDOWN_SECONDS
+            },
+            "recent_decisions": list(self.decisions)
+        }
+
 # Singleton instance
 submission_limiter = RateLimiter()
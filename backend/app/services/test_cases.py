@@ -0,0 +1,111 @@
+"""
+Bulk persistence for test cases and course problems.
+
+Endpoints that create or replace many rows go through here instead of adding
+ORM objects one at a time: inserts are multi-row INSERT ... VALUES statements
+(chunked to stay under the driver's parameter limit), and replacing a
+problem's test cases only touches the rows that actually changed.
+
+Nothing here commits; callers keep the whole request in one transaction.
+Works for both test problems (TestCase) and course steps (CourseProblemTestCase),
+which share the problem_id / input_data / expected_output / is_hidden columns.
+"""
+
+from collections import defaultdict
+from typing import Iterable, List
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
+
+# 4-5 columns per row keeps every statement well below 65535 bind parameters
+CHUNK_SIZE = 1000
+
+
+def _field(tc, name: str, default=None):
+    if isinstance(tc, dict):
+        return tc.get(name, default)
+    return getattr(tc, name, default)
+
+
+def _case_row(problem_id: int, tc, default_hidden: bool) -> dict:
+    hidden = _field(tc, "is_hidden")
+    return {
+        "problem_id": problem_id,
+        "input_data": _field(tc, "input_data", ""),
+        "expected_output": _field(tc, "expected_output", ""),
+        "is_hidden": default_hidden if hidden is None else hidden
+    }
+
+
+def _chunks(rows: List[dict]) -> Iterable[List[dict]]:
+    for start in range(0, len(rows), CHUNK_SIZE):
+        yield rows[start:start + CHUNK_SIZE]
+
+
+def insert_rows(db: Session, model, rows: List[dict], returning=None) -> list:
+    """Multi-row INSERT of plain dicts; returns the RETURNING rows if columns are given."""
+    returned = []
+    for chunk in _chunks(rows):
+        stmt = insert(model).values(chunk)
+        if returning is not None:
+            returned.extend(db.execute(stmt.returning(*returning)).all())
+        else:
+            db.execute(stmt)
+    return returned
+
+
+def insert_test_cases(db: Session, model, problem_id: int, cases: list, default_hidden: bool = True) -> int:
+    """Insert all test cases for one problem (dicts or schema objects)."""
+    rows = [_case_row(problem_id, tc, default_hidden) for tc in cases]
+    insert_rows(db, model, rows)
+    return len(rows)
+
+
+def sync_test_cases(db: Session, model, problem_id: int, cases: list, default_hidden: bool = True) -> dict:
+    """
+    Make a problem's test cases match `cases` with the fewest writes.
+
+    Cases are matched on (input_data, expected_output): matches are kept
+    (updating is_hidden if it changed), unmatched existing rows are deleted
+    and unmatched new cases are inserted.
+    """
+    existing = db.execute(
+        select(model.id, model.input_data, model.expected_output, model.is_hidden)
+        .filter(model.problem_id == problem_id)
+        .order_by(model.id)
+    ).all()
+
+    available = defaultdict(list)
+    for row in existing:
+        available[(row.input_data, row.expected_output)].append(row)
+
+    to_insert = []
+    hidden_changes = {True: [], False: []}
+    kept = 0
+    for tc in cases:
+        row = _case_row(problem_id, tc, default_hidden)
+        matches = available.get((row["input_data"], row["expected_output"]))
+        if matches:
+            match = matches.pop(0)
+            kept += 1
+            if match.is_hidden != row["is_hidden"]:
+                hidden_changes[row["is_hidden"]].append(match.id)
+        else:
+            to_insert.append(row)
+
+    to_delete = [row.id for rows in available.values() for row in rows]
+
+    if to_delete:
+        db.execute(delete(model).where(model.id.in_(to_delete)))
+    for is_hidden, ids in hidden_changes.items():
+        if ids:
+            db.execute(update(model).where(model.id.in_(ids)).values(is_hidden=is_hidden))
+    insert_rows(db, model, to_insert)
+
+    return {
+        "kept": kept,
+        "updated": len(hidden_changes[True]) + len(hidden_changes[False]),
+        "inserted": len(to_insert),
+        "deleted": len(to_delete)
+    }
+
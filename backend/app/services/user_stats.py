@@ -0,0 +1,193 @@
+"""
+Per-user statistics rollup.
+
+Every test Submission and learning SubmissionLog bumps the user's
+user_stats row and their user_daily_activity row for the day with
+upserts in the same transaction, so the dashboard reads one row (stats)
+or at most 30 rows (heatmap) instead of the user's whole history.
+
+First solves are claimed by inserting into user_solved_problems, so two
+concurrent passing attempts cannot both count towards unique_solved. Days are
+always the database's CURRENT_DATE, the same clock the rebuild uses.
+"""
+
+from datetime import date, timedelta
+from typing import Optional
+
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.models import models
+
+
+def claim_first_solve(db: Session, user_id: int, source: str, problem_id: int) -> bool:
+    """
+    Record that the user passed a problem ("TEST") or course step ("LEARNING").
+    True only for the attempt whose insert created the row: a concurrent
+    attempt waits on the first one's insert and then conflicts.
+    Does not commit: call it in the transaction that persists the attempt.
+    """
+    stmt = insert(models.UserSolvedProblem).values(
+        user_id=user_id, source=source, problem_id=problem_id
+    ).on_conflict_do_nothing().returning(models.UserSolvedProblem.user_id)
+    return db.execute(stmt).first() is not None
+
+
+def record_attempt(db: Session, user_id: int, passed: bool, first_solve: bool = False, day: Optional[date] = None) -> None:
+    """
+    Fold one attempt into the user's rollup row, on the database's current date
+    unless `day` is given.
+    Does not commit: call it before the commit that persists the attempt.
+    """
+    day = day if day is not None else func.current_date()
+    table = models.UserStats.__table__
+
+    stmt = insert(models.UserStats).values(
+        user_id=user_id,
+        total_attempts=1,
+        passed_attempts=1 if passed else 0,
+        failed_attempts=0 if passed else 1,
+        unique_solved=1 if passed and first_solve else 0,
+        last_active_date=day,
+        current_streak=1
+    )
+    excluded = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id],
+        set_={
+            "total_attempts": table.c.total_attempts + 1,
+            "passed_attempts": table.c.passed_attempts + excluded.passed_attempts,
+            "failed_attempts": table.c.failed_attempts + excluded.failed_attempts,
+            "unique_solved": table.c.unique_solved + excluded.unique_solved,
+            # SET sees the old row, so the streak is judged against the previous active day
+            "current_streak": text(
+                "CASE WHEN user_stats.last_active_date = excluded.last_active_date THEN user_stats.current_streak "
+                "WHEN user_stats.last_active_date = excluded.last_active_date - 1 THEN user_stats.current_streak + 1 "
+                "WHEN user_stats.last_active_date > excluded.last_active_date THEN user_stats.current_streak "
+                "ELSE 1 END"
+            ),
+            "last_active_date": func.greatest(table.c.last_active_date, excluded.last_active_date),
+            "updated_at": func.now()
+        }
+    )
+    db.execute(stmt)
+
+    activity = insert(models.UserDailyActivity).values(
+        user_id=user_id,
+        day=day,
+        attempts=1,
+        passes=1 if passed else 0
+    )
+    activity = activity.on_conflict_do_update(
+        index_elements=[models.UserDailyActivity.user_id, models.UserDailyActivity.day],
+        set_={
+            "attempts": models.UserDailyActivity.attempts + 1,
+            "passes": models.UserDailyActivity.passes + activity.excluded.passes
+        }
+    )
+    db.execute(activity)
+
+
+def active_streak(stats: Optional[models.UserStats], today: Optional[date] = None) -> int:
+    """
+    A streak only counts while the last active day is today or yesterday.
+    Pass the database's CURRENT_DATE as `today` so it matches record_attempt.
+    """
+    if not stats or not stats.last_active_date:
+        return 0
+    today = today or date.today()
+    if stats.last_active_date >= today - timedelta(days=1):
+        return stats.current_streak
+    return 0
+
+
+REBUILD_SQL = """
+    WITH attempts AS (
+        SELECT user_id, problem_id, verdict, created_at::date AS day, 'TEST' AS source FROM submissions
+        UNION ALL
+        SELECT user_id, problem_id, verdict, timestamp::date AS day, 'LEARNING' AS source FROM submission_logs
+    ),
+    totals AS (
+        SELECT
+            user_id,
+            COUNT(*) AS total_attempts,
+            COUNT(*) FILTER (WHERE verdict = 'Passed') AS passed_attempts,
+            COUNT(*) FILTER (WHERE verdict IS DISTINCT FROM 'Passed') AS failed_attempts,
+            COUNT(DISTINCT problem_id) FILTER (WHERE verdict = 'Passed' AND source = 'TEST')
+              + COUNT(DISTINCT problem_id) FILTER (WHERE verdict = 'Passed' AND source = 'LEARNING') AS unique_solved
+        FROM attempts
+        GROUP BY user_id
+    ),
+    days AS (
+        SELECT DISTINCT user_id, day FROM attempts
+    ),
+    islands AS (
+        -- Consecutive days share the same (day - row_number) anchor
+        SELECT user_id, day, day - (ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY day))::int AS anchor
+        FROM days
+    ),
+    latest_run AS (
+        SELECT DISTINCT ON (user_id) user_id, MAX(day) AS last_active_date, COUNT(*) AS current_streak
+        FROM islands
+        GROUP BY user_id, anchor
+        ORDER BY user_id, MAX(day) DESC
+    )
+    INSERT INTO user_stats (user_id, total_attempts, passed_attempts, failed_attempts, unique_solved, last_active_date, current_streak, updated_at)
+    SELECT t.user_id, t.total_attempts, t.passed_attempts, t.failed_attempts, t.unique_solved, r.last_active_date, r.current_streak, now()
+    FROM totals t
+    JOIN latest_run r ON r.user_id = t.user_id
+    JOIN users u ON u.id = t.user_id
+"""
+
+
+REBUILD_DAILY_ACTIVITY_SQL = """
+    INSERT INTO user_daily_activity (user_id, day, attempts, passes)
+    SELECT a.user_id, a.day, COUNT(*), COUNT(*) FILTER (WHERE a.verdict = 'Passed')
+    FROM (
+        SELECT user_id, verdict, created_at::date AS day FROM submissions
+        UNION ALL
+        SELECT user_id, verdict, timestamp::date AS day FROM submission_logs
+    ) a
+    JOIN users u ON u.id = a.user_id
+    GROUP BY a.user_id, a.day
+"""
+
+
+REBUILD_SOLVED_SQL = """
+    INSERT INTO user_solved_problems (user_id, source, problem_id, solved_at)
+    SELECT s.user_id, s.source, s.problem_id, MIN(s.solved_at)
+    FROM (
+        SELECT user_id, 'TEST' AS source, problem_id, created_at AS solved_at
+        FROM submissions WHERE verdict = 'Passed'
+        UNION ALL
+        SELECT user_id, 'LEARNING' AS source, problem_id, timestamp AS solved_at
+        FROM submission_logs WHERE verdict = 'Passed'
+    ) s
+    JOIN users u ON u.id = s.user_id
+    WHERE s.problem_id IS NOT NULL
+    GROUP BY s.user_id, s.source, s.problem_id
+"""
+
+
+def rebuild_user_stats(db: Session) -> int:
+    """Recompute every rollup row from history in one transaction. Returns the number of rows."""
+    db.execute(text("DELETE FROM user_stats"))
+    db.execute(text("DELETE FROM user_daily_activity"))
+    db.execute(text("DELETE FROM user_solved_problems"))
+    db.execute(text(REBUILD_SQL))
+    db.execute(text(REBUILD_DAILY_ACTIVITY_SQL))
+    db.execute(text(REBUILD_SOLVED_SQL))
+    db.commit()
+    return db.query(func.count(models.UserStats.user_id)).scalar()
+
+
+if __name__ == "__main__":
+    # python -m app.services.user_stats
+    from app.db.database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        print(f"User stats rebuilt: {rebuild_user_stats(session)} users")
+    finally:
+        session.close()
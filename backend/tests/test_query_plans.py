@@ -0,0 +1,199 @@
+"""
+Query-plan regression test for the hot-query indexes (migration d4e5f6a7b8c9).
+
+Seeds users, problems, tests, submissions, learning logs, proctoring events and
+enrollments, then runs EXPLAIN (FORMAT JSON) on the queries the dashboard,
+admin results and proctoring views issue, and fails if any of them reads an
+indexed table (or one of its partitions) with a sequential scan.
+
+Needs a migrated Postgres database and is skipped without one:
+    TEST_DATABASE_URL=postgresql://... python -m pytest tests/test_query_plans.py
+
+Everything runs in one transaction that is rolled back, so the seed rows never
+persist. Sequential scans are disabled for the session: the planner still falls
+back to one when no index can serve a predicate, which is exactly the
+regression this test catches, while small seed sizes cannot flip its choice.
+"""
+
+import os
+import re
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.dialects import postgresql
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+
+# Tables covered by the hot-query indexes
+INDEXED_TABLES = ["submissions", "submission_logs", "behavior_logs", "test_enrollments", "scheduled_tests"]
+
+USERS = 400
+PROBLEMS = 40
+TESTS = 200
+STEPS = 40
+ROWS = 20000
+
+
+def _seed(conn) -> dict:
+    run = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S%f")
+
+    users = conn.execute(text("""
+        INSERT INTO users (email, username, hashed_password, role)
+        SELECT 'plan_' || :run || '_' || g || '@example.test', 'plan_' || :run || '_' || g, 'x', 'STUDENT'
+        FROM generate_series(1, :n) g
+        RETURNING id"""), {"run": run, "n": USERS}).scalars().all()
+
+    problems = conn.execute(text("""
+        INSERT INTO problems (title, description, difficulty, category, is_test_problem)
+        SELECT 'Plan problem ' || g, '', 'Easy', 'plan', g % 2 = 0
+        FROM generate_series(1, :n) g
+        RETURNING id"""), {"n": PROBLEMS}).scalars().all()
+
+    # Only every 20th test is active; the rest ended days ago
+    tests = conn.execute(text("""
+        INSERT INTO scheduled_tests (title, start_time, end_time, is_active)
+        SELECT 'Plan test ' || g, now() - make_interval(days => g) - interval '1 hour',
+               now() - make_interval(days => g) + interval '1 hour', g % 20 = 0
+        FROM generate_series(1, :n) g
+        RETURNING id"""), {"n": TESTS}).scalars().all()
+
+    course_id = conn.execute(text("""
+        INSERT INTO courses (language, level, level_order, editor_language, is_active)
+        VALUES ('plan_' || :run, 'Beginner', 1, 'python', true)
+        RETURNING id"""), {"run": run}).scalar()
+    steps = conn.execute(text("""
+        INSERT INTO course_problems (course_id, step_number, title, description)
+        SELECT :course_id, g, 'Plan step ' || g, ''
+        FROM generate_series(1, :n) g
+        RETURNING id"""), {"course_id": course_id, "n": STEPS}).scalars().all()
+
+    ids = {"users": users, "problems": problems, "tests": tests, "steps": steps, "n": ROWS}
+    pick = "(CAST(:{0} AS int[]))[1 + (g * {1}) % cardinality(CAST(:{0} AS int[]))]"
+
+    conn.execute(text(f"""
+        INSERT INTO submissions (user_id, problem_id, test_id, verdict, passed_cases, total_cases,
+                                 execution_time_ms, is_test_submission, created_at)
+        SELECT {pick.format("users", 1)}, {pick.format("problems", 7)},
+               CASE WHEN g % 3 = 0 THEN {pick.format("tests", 13)} END,
+               CASE WHEN g % 4 = 0 THEN 'Passed' ELSE 'Failed' END, 1, 1, 1.0, g % 2 = 0,
+               now() - make_interval(mins => g * 7)
+        FROM generate_series(1, :n) g"""), ids)
+    conn.execute(text(f"""
+        INSERT INTO submission_logs (user_id, problem_id, verdict, execution_time, timeout_flag, payload_size, timestamp)
+        SELECT {pick.format("users", 1)}, {pick.format("steps", 7)},
+               CASE WHEN g % 4 = 0 THEN 'Passed' ELSE 'Failed' END, 0.1, false, 100,
+               now() - make_interval(mins => g * 7)
+        FROM generate_series(1, :n) g"""), ids)
+    conn.execute(text(f"""
+        INSERT INTO behavior_logs (user_id, test_id, event_type, severity, details, timestamp)
+        SELECT {pick.format("users", 1)}, {pick.format("tests", 13)}, 'TAB_SWITCH', 'LOW', '',
+               now() - make_interval(mins => g * 7)
+        FROM generate_series(1, :n) g"""), ids)
+    conn.execute(text(f"""
+        INSERT INTO test_enrollments (test_id, user_id, status)
+        SELECT {pick.format("tests", 13)}, {pick.format("users", 1)},
+               CASE WHEN g % 5 = 0 THEN 'COMPLETED' ELSE 'PRESENT' END
+        FROM generate_series(1, :n / 4) g"""), ids)
+
+    for table in INDEXED_TABLES:
+        conn.execute(text(f"ANALYZE {table}"))
+
+    active_test = tests[19]  # g = 20
+    return {
+        "user_id": users[USERS // 2],
+        "problem_id": problems[3],
+        "test_id": active_test,
+        "problem_ids": problems[:5]
+    }
+
+
+@pytest.fixture(scope="module")
+def seeded():
+    engine = create_engine(TEST_DATABASE_URL)
+    conn = engine.connect()
+    transaction = conn.begin()
+    try:
+        if conn.execute(text("SELECT to_regclass('submissions')")).scalar() is None:
+            pytest.skip("database is not migrated")
+        ids = _seed(conn)
+        conn.execute(text("SET LOCAL enable_seqscan = off"))
+        yield conn, ids
+    finally:
+        transaction.rollback()
+        conn.close()
+        engine.dispose()
+
+
+def _plan_nodes(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+def seq_scanned_tables(conn, query) -> list:
+    """Indexed tables (or their partitions) that the plan reads with a Seq Scan."""
+    compiled = query.compile(dialect=postgresql.dialect(), compile_kwargs={"render_postcompile": True})
+    plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+    pattern = re.compile(rf"^({'|'.join(INDEXED_TABLES)})(_p\d{{4}}_\d{{2}}|_default)?$")
+    return [
+        node["Relation Name"]
+        for node in _plan_nodes(plan[0]["Plan"])
+        if node["Node Type"] == "Seq Scan" and pattern.match(node.get("Relation Name", ""))
+    ]
+
+
+def _hot_queries(ids: dict) -> dict:
+    from app.api.v1.endpoints.admin import build_test_results_query
+    from app.api.v1.endpoints.student import submission_history_query
+    from app.models import models
+
+    now = datetime.now(timezone.utc)
+    test = models.ScheduledTest(id=ids["test_id"], start_time=now - timedelta(hours=1), end_time=now + timedelta(hours=1))
+
+    return {
+        # Student dashboard history: Submission(user_id, created_at) + SubmissionLog(user_id, timestamp)
+        "submission_history": submission_history_query(ids["user_id"], 20),
+        # Per-test history: Submission(test_id, user_id)
+        "test_submission_history": submission_history_query(ids["user_id"], 20, test_id=ids["test_id"]),
+        # Admin results: Submission(test_id, ...) OR Submission(problem_id, created_at), TestEnrollment(test_id, ...)
+        "test_results": build_test_results_query(test, ids["problem_ids"]),
+        # Active test lookup: ScheduledTest(is_active, start_time, end_time)
+        "active_tests": select(models.ScheduledTest).filter(
+            models.ScheduledTest.is_active == True,
+            models.ScheduledTest.start_time <= now,
+            models.ScheduledTest.end_time >= now
+        ),
+        # Re-entry check: TestEnrollment(test_id, user_id, status)
+        "enrollment": select(models.TestEnrollment).filter(
+            models.TestEnrollment.test_id == ids["test_id"],
+            models.TestEnrollment.user_id == ids["user_id"]
+        ),
+        # Proctoring events of one student in one test: BehaviorLog(test_id, user_id)
+        "behavior_events": select(models.BehaviorLog).filter(
+            models.BehaviorLog.test_id == ids["test_id"],
+            models.BehaviorLog.user_id == ids["user_id"]
+        ).order_by(models.BehaviorLog.timestamp),
+        # Recent submissions of a problem: Submission(problem_id, created_at)
+        "problem_recent_submissions": select(models.Submission.id, models.Submission.verdict).filter(
+            models.Submission.problem_id == ids["problem_id"],
+            models.Submission.created_at >= now - timedelta(days=7)
+        ).order_by(models.Submission.created_at.desc()).limit(50),
+    }
+
+
+@pytest.mark.parametrize("name", [
+    "submission_history",
+    "test_submission_history",
+    "test_results",
+    "active_tests",
+    "enrollment",
+    "behavior_events",
+    "problem_recent_submissions",
+])
+def test_hot_query_uses_indexes(seeded, name):
+    conn, ids = seeded
+    query = _hot_queries(ids)[name]
+    assert seq_scanned_tables(conn, query) == [], f"{name} falls back to a sequential scan"
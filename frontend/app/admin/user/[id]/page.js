@@ -35,9 +35,8 @@ export default function UserStats() {
         if (id && id !== "undefined") {
             const fetchData = async () => {
                 try {
-                    const profileRes = await fetch(`${API_URL}/admin/leaderboard`);
-                    const leaderboard = await profileRes.json();
-                    const found = leaderboard.find(u => u.id === parseInt(id));
+                    const profileRes = await fetch(`${API_URL}/admin/leaderboard/rank/${id}`);
+                    const found = profileRes.ok ? await profileRes.json() : null;
                     setTargetUser(found);
 
                     const statsRes = await fetch(`${API_URL}/student/stats/${id}`);
@@ -3,6 +3,8 @@ import React, { useEffect, useState, useRef } from 'react';
 import { AlertCircle, Maximize, Camera, CameraOff, ShieldAlert } from 'lucide-react';
 
 const API_URL = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000/api/v1";
+const EVENT_BATCH_SIZE = 20;
+const EVENT_FLUSH_MS = 2000;
 
 export default function FullScreenProctor({ onViolation, isEnabled, userId, problemId, testId, onKickOut, onFullscreenChange }) {
     const [isFullscreen, setIsFullscreen] = useState(false);
@@ -19,6 +21,8 @@ export default function FullScreenProctor({ onViolation, isEnabled, userId, prob
     const modelRef = useRef(null);
     const detectionIntervalRef = useRef(null);
     const lastViolationRef = useRef({}); // For cooldown
+    const pendingEventsRef = useRef([]);
+    const flushTimerRef = useRef(null);
     const [modelLoaded, setModelLoaded] = useState(false);
 
 
@@ -43,6 +47,7 @@ export default function FullScreenProctor({ onViolation, isEnabled, userId, prob
             if (detectionIntervalRef.current) {
                 clearInterval(detectionIntervalRef.current);
             }
+            flushEvents();
         };
     }, [isEnabled]);
 
@@ -252,26 +257,44 @@ export default function FullScreenProctor({ onViolation, isEnabled, userId, prob
         setWarnings(prev => [...prev.slice(-2), newWarning]);
     };
 
-    const logViolation = async (eventType, severity, details) => {
+    // Events are queued and sent in batches; CRITICAL events go out immediately
+    const flushEvents = async () => {
+        if (flushTimerRef.current) {
+            clearTimeout(flushTimerRef.current);
+            flushTimerRef.current = null;
+        }
+        const events = pendingEventsRef.current;
+        if (events.length === 0) return;
+        pendingEventsRef.current = [];
         try {
             const token = localStorage.getItem("token");
-            await fetch(`${API_URL}/student/log-behavior`, {
+            await fetch(`${API_URL}/student/log-behavior/batch`, {
                 method: 'POST',
+                keepalive: true,
                 headers: {
                     'Content-Type': 'application/json',
                     'Authorization': `Bearer ${token}`
                 },
-                body: JSON.stringify({
-                    user_id: userId,
-                    problem_id: problemId,
-                    test_id: testId,
-                    event_type: eventType,
-                    severity: severity,
-                    details: details
-                })
+                body: JSON.stringify({ events })
             });
         } catch (err) {
-            console.error("Failed to log violation:", err);
+            console.error("Failed to log violations:", err);
+        }
+    };
+
+    const logViolation = (eventType, severity, details) => {
+        pendingEventsRef.current.push({
+            problem_id: problemId,
+            test_id: testId,
+            event_type: eventType,
+            severity: severity,
+            details: details,
+            timestamp: Date.now()
+        });
+        if (severity === 'CRITICAL' || pendingEventsRef.current.length >= EVENT_BATCH_SIZE) {
+            flushEvents();
+        } else if (!flushTimerRef.current) {
+            flushTimerRef.current = setTimeout(flushEvents, EVENT_FLUSH_MS);
         }
     };
 